@@ -1,74 +1,273 @@
 import os
-import json
-from flask import Flask, request, jsonify
-from instagrapi import Client
+from flask import Flask, Blueprint, current_app, request, Response, stream_with_context, send_file
 from flask_cors import CORS
 import logging
 from dotenv import load_dotenv
 import time
-from datetime import datetime
-from models import db, Influencer, generate_otp,send_otp_via_email
-import re
-import requests
-import base64
+from datetime import datetime, timedelta
+from models import db, Influencer, send_otp_via_email, bulk_upsert_influencers, bulk_insert_snapshots, snapshot_history
+import instagrapi.exceptions
+from sqlalchemy import text
+import functools
+import threading
 import random
 import smtplib
 from pydantic import BaseModel
+import cache
+from ratelimit import governor
+import upstream
+from upstream import (
+    get_session_pool,
+    media_pk_from_url,
+    fetch_user_info,
+    fetch_user_medias,
+    fetch_media_likers,
+    fetch_media_comments,
+    fetch_media_likers_page,
+    fetch_media_comments_page,
+    iter_media_comment_pages,
+)
+from pagination import encode_cursor, decode_cursor, parse_limit, DEFAULT_PAGE_SIZE
+import images
+from images import profile_pic_fields
+from jobs import job_queue, FINISHED_STATUSES
+from outbox import OtpOutbox, OTP_ECHO
+from writebehind import WriteBehindBuffer
+from scheduler import RefreshScheduler, SCHEDULER_ENABLED
+from urls import shortcode_from_url, media_pks_from_urls
+from mediastore import media_summary
+from engagement import profile_stats, STATS_DEFAULT_WINDOW, STATS_MAX_WINDOW
+from fanout import fan_out, FANOUT_MAX_WORKERS, FANOUT_ITEM_TIMEOUT
+import metrics
+import responses
+from responses import jsonify, dumps, requested_fields, wants, project
 
 # Load environment variables from .env file
 load_dotenv()
 
-app = Flask(__name__)
-CORS(app)
+# Routes live on a blueprint; create_app() at the bottom of this module builds the application
+api = Blueprint('api', __name__)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Configure database
-NEON_DB_URL = os.getenv('NEON_DB_URL')
-if not NEON_DB_URL:
-    logger.error("NeonDB URL not set in environment variables.")
-    raise ValueError("NEON_DB_URL is required.")
-
-app.config['SQLALCHEMY_DATABASE_URI'] = NEON_DB_URL
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-# Initialize SQLAlchemy
-db.init_app(app)
-
-# Create database tables
-with app.app_context():
-    db.create_all()
-
-# Initialize Instagrapi client
-client = Client()
-
-# Retrieve credentials and session JSON string from environment variables
-USERNAME = os.getenv('INSTAGRAM_USERNAME')
-PASSWORD = os.getenv('INSTAGRAM_PASSWORD')
-SESSION_JSON_STRING = os.getenv('INSTAGRAM_SESSION_JSON')  # Get session JSON string
-
-if not SESSION_JSON_STRING:
-    logger.error("Instagram session JSON is not set in environment variables.")
-    raise ValueError("Instagram session JSON is not set in environment variables.")
-
-# Load session from the JSON string
-try:
-    session_data = json.loads(SESSION_JSON_STRING)
-    client.set_settings(session_data)
-    logger.info("Session loaded successfully.")
-
-    if not client.user_id:
-        logger.error("Invalid session. Please run create_session.py to regenerate the session.")
-except json.JSONDecodeError as e:
-    logger.error(f"Error decoding JSON: {str(e)}")
-    raise
-except Exception as e:
-    logger.error(f"An error occurred during session loading: {str(e)}")
-    raise
-
-@app.route('/profile', methods=['GET'])
+# Tables are created by migrate.py at deploy time; set DB_AUTO_CREATE=1 to create them on first use instead
+DB_AUTO_CREATE = os.getenv('DB_AUTO_CREATE', '0') == '1'
+
+# Influencer rows are written behind the request path in batched upserts
+influencer_writer = WriteBehindBuffer('influencer', bulk_upsert_influencers)
+
+# Follower history is appended behind the request path as well, at most once per
+# SNAPSHOT_MIN_INTERVAL per username so cached profile hits don't pile up duplicates
+SNAPSHOT_MIN_INTERVAL = int(os.getenv('SNAPSHOT_MIN_INTERVAL', '300'))
+snapshot_writer = WriteBehindBuffer('influencer_snapshot', bulk_insert_snapshots)
+_last_snapshot = {}
+_last_snapshot_lock = threading.Lock()
+
+def queue_influencer_update(profile, engagement=None):
+    influencer_writer.add(profile.username, {
+        'username': profile.username,
+        'followers': profile.follower_count,
+        'following': profile.following_count,
+        'updated_at': datetime.utcnow(),
+    })
+    queue_snapshot(profile, engagement)
+
+def queue_snapshot(profile, engagement=None):
+    now = datetime.utcnow()
+    with _last_snapshot_lock:
+        last = _last_snapshot.get(profile.username)
+        if engagement is None and last and (now - last).total_seconds() < SNAPSHOT_MIN_INTERVAL:
+            return
+        _last_snapshot[profile.username] = now
+    snapshot_writer.add((profile.username, now), {
+        'username': profile.username,
+        'ts': now,
+        'followers': profile.follower_count,
+        'following': profile.following_count,
+        'media_count': profile.media_count,
+        'engagement': engagement,
+    })
+
+# Background refresh of tracked influencers, stalest first, within an hourly upstream budget
+def refresh_influencer(username):
+    profile = fetch_user_info(username, bypass=True)
+    queue_influencer_update(profile)
+
+refresh_scheduler = RefreshScheduler(refresh_influencer)
+
+# OTP DMs are recorded in a persistent outbox and delivered in the background under the DM budget
+otp_outbox = OtpOutbox(lambda text, user_pk: upstream.call('direct_send', text, [user_pk]))
+
+# Cache bypass for a single request via ?nocache=1
+def cache_bypass_requested():
+    return request.args.get('nocache') == '1'
+
+# NDJSON streaming via ?stream=1
+def stream_requested():
+    return request.args.get('stream') == '1'
+
+@api.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    return jsonify(cache.stats()), 200
+
+def rate_limit_stats():
+    """Instagram budgets summed over the session pool, plus the process-wide CDN budget."""
+    stats = get_session_pool().rate_limit_stats()
+    stats['cdn'] = governor.bucket('cdn').stats()
+    return stats
+
+@api.route('/ratelimit/stats', methods=['GET'])
+def get_ratelimit_stats():
+    return jsonify(rate_limit_stats()), 200
+
+@api.route('/sessions/stats', methods=['GET'])
+def get_session_stats():
+    return jsonify(get_session_pool().stats()), 200
+
+@api.route('/jobs/stats', methods=['GET'])
+def get_job_stats():
+    return jsonify(job_queue.stats()), 200
+
+@api.route('/scheduler/stats', methods=['GET'])
+def get_scheduler_stats():
+    return jsonify(refresh_scheduler.stats()), 200
+
+@api.route('/db/stats', methods=['GET'])
+def get_db_stats():
+    return jsonify({
+        'pool': db.engine.pool.status(),
+        'influencer_writes': influencer_writer.stats(),
+        'snapshot_writes': snapshot_writer.stats(),
+    }), 200
+
+@api.route('/outbox/stats', methods=['GET'])
+def get_outbox_stats():
+    return jsonify(otp_outbox.stats()), 200
+
+# Point-in-time state owned by other components, sampled on every scrape
+@metrics.registry.register_collector
+def collect_component_metrics():
+    cache_stats = cache.stats()
+    cache_gauge = metrics.Gauge('cache_state', 'Upstream cache counters and size.', ('stat',))
+    for stat in ('hits', 'misses', 'shared_hits', 'bypasses', 'evictions', 'entries', 'hit_ratio'):
+        cache_gauge.set(cache_stats[stat], stat=stat)
+
+    pool_stats = get_session_pool().stats()
+    sessions_gauge = metrics.Gauge('instagram_sessions', 'Instagram sessions in the pool, by state.', ('state',))
+    for state in ('size', 'available', 'in_use', 'quarantined'):
+        sessions_gauge.set(pool_stats[state], state=state)
+
+    tokens_gauge = metrics.Gauge('rate_limit_tokens', 'Tokens left in each rate budget, by session (shared for the CDN).',
+                                 ('budget', 'session'))
+    for session_name, session_stats in pool_stats['sessions'].items():
+        for name, bucket in session_stats['rate_limits'].items():
+            if name != 'cdn':
+                tokens_gauge.set(bucket['tokens'], budget=name, session=session_name)
+    tokens_gauge.set(governor.bucket('cdn').stats()['tokens'], budget='cdn', session='shared')
+
+    jobs_gauge = metrics.Gauge('jobs', 'Background jobs on this host, by status.', ('status',))
+    for status, count in job_queue.stats().items():
+        if status != 'workers':
+            jobs_gauge.set(count, status=status)
+
+    writes_gauge = metrics.Gauge('db_write_behind_pending', 'Rows waiting in the write-behind buffers.', ('buffer',))
+    writes_gauge.set(influencer_writer.stats()['pending'], buffer='influencer')
+    writes_gauge.set(snapshot_writer.stats()['pending'], buffer='influencer_snapshot')
+
+    pool_gauge = metrics.Gauge('db_pool_checked_out', 'Database connections currently checked out.')
+    checkedout = getattr(db.engine.pool, 'checkedout', None)
+    if checkedout is not None:
+        pool_gauge.set(checkedout())
+    return [cache_gauge, sessions_gauge, tokens_gauge, jobs_gauge, writes_gauge, pool_gauge]
+
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# Cached profile pictures, addressed by the SHA-256 of their content
+@api.route('/media/pic/<content_hash>', methods=['GET'])
+def get_cached_pic(content_hash):
+    if not images.is_valid_hash(content_hash) or not os.path.exists(images.blob_path(content_hash)):
+        return jsonify({'error': 'Image not found.'}), 404
+
+    response = send_file(images.blob_path(content_hash), mimetype='image/jpeg', add_etags=False, conditional=False)
+    # Content never changes for a given hash, so the hash is a strong ETag
+    response.set_etag(content_hash)
+    response.cache_control.public = True
+    response.cache_control.max_age = 31536000
+    return response.make_conditional(request, accept_ranges=True, complete_length=os.path.getsize(images.blob_path(content_hash)))
+
+def profile_fields(profile):
+    """Public profile fields shared by the profile endpoints."""
+    return {
+        'username': profile.username,
+        'full_name': profile.full_name,
+        'bio': profile.biography,
+        'followers': profile.follower_count,
+        'following': profile.following_count,
+        'posts': profile.media_count,
+        'is_business': profile.is_business,
+        'email': profile.public_email,
+        'phone_number': profile.contact_phone_number,
+        'category': profile.category,
+    }
+
+# Keys filled in by profile_pic_fields; the picture is only downloaded when one of them is wanted
+PROFILE_PIC_FIELDS = ('profile_pic_base64', 'profile_pic_hash', 'profile_pic_cached_url')
+
+def wanted_pic_fields(url, mode, fields):
+    if not wants(fields, *PROFILE_PIC_FIELDS):
+        return {}
+    return profile_pic_fields(url, mode)
+
+def queue_otp(profile):
+    """Queues an OTP DM for profile and returns the response fields describing it."""
+    otp_message, otp = otp_outbox.enqueue(profile.username, profile.pk, profile.full_name or profile.username)
+
+    otp_data = {}
+    if otp is not None and OTP_ECHO:
+        otp_data['otp'] = otp
+    otp_data['otp_id'] = otp_message['id']
+    otp_data['otp_status_url'] = f"/otp/{otp_message['id']}"
+    otp_data['dm_status'] = otp_message['status']
+    otp_data['dm_sent'] = otp_message['status'] == 'sent'
+    if otp is None:
+        otp_data['message'] = f"An OTP was already sent to {profile.username} recently"
+    else:
+        otp_data['message'] = f"OTP queued for DM to {profile.username}"
+    return otp_data
+
+# Response building shared by these views and the async handlers in asgi.py, so the two
+# entry points only differ in how they fetch from upstream
+def profile_response(username, profile, pic_data, fields, otp_data=None):
+    """Body of /profile and /profileSearch from the fetched profile and picture. Queues the profile for storage."""
+    profile_data = profile_fields(profile)
+    profile_data.update(pic_data)
+    profile_data = project(profile_data, fields)
+    if otp_data is not None:
+        profile_data.update(otp_data)
+
+    # Log and store profile data
+    logger.debug(f"Retrieved profile data for {username}: {profile_data}")
+
+    queue_influencer_update(profile)
+    logger.info(f"Profile data for {username} has been queued for storage in the database.")
+    return profile_data
+
+def profile_error(username, e):
+    """(payload, status) for a failed profile lookup."""
+    if isinstance(e, instagrapi.exceptions.UserNotFound):
+        logger.warning(f"User {username} not found.")
+        return {'error': 'User not found.'}, 404
+    if isinstance(e, instagrapi.exceptions.ClientError):
+        logger.error(f"Client error: {str(e)}")
+        return {'error': 'A client error occurred.'}, 400
+    logger.error(f"An unexpected error occurred in get_profile: {str(e)}")
+    return {'error': 'An unexpected error occurred.'}, 500
+
+@api.route('/profile', methods=['GET'])
 def get_profile():
     username = request.args.get('username')
 
@@ -77,72 +276,50 @@ def get_profile():
 
     try:
         # Load the profile
-        profile = client.user_info_by_username(username)
-
-        # Prepare the profile data
-        profile_data = {
-            'username': profile.username,
-            'full_name': profile.full_name,
-            'bio': profile.biography,
-            'followers': profile.follower_count,
-            'following': profile.following_count,
-            'posts': profile.media_count,
-            'is_business': profile.is_business,
-            'email': profile.public_email,
-            'phone_number': profile.contact_phone_number,
-            'category': profile.category,
-        }
+        profile = fetch_user_info(username, bypass=cache_bypass_requested())
 
-        # Fetch profile picture
-        profile_pic_response = requests.get(profile.profile_pic_url)
-        profile_pic_base64 = base64.b64encode(profile_pic_response.content).decode('utf-8')
-        profile_data['profile_pic_base64'] = profile_pic_base64
+        # Fetch profile picture, unless ?fields= leaves it out
+        fields = requested_fields()
+        pic_data = wanted_pic_fields(profile.profile_pic_url, request.args.get('pic'), fields)
 
-        # Generate OTP
-        otp = generate_otp()
+        # Queue the OTP DM; the outbox dispatcher sends it, so a slow or failing DM never blocks the lookup
+        otp_data = queue_otp(profile)
 
-        # Send OTP via DM
-        user_id = profile.pk  # Primary key of the user
-        dm_message = f"Hello {profile.full_name or profile.username}, your OTP is: {otp}"
-        client.direct_send(dm_message, [user_id])
+        return jsonify(profile_response(username, profile, pic_data, fields, otp_data)), 200
 
-        profile_data['otp'] = otp
-        profile_data['dm_sent'] = True
-        profile_data['message'] = f"OTP sent via DM to {profile.username}"
-
-        # Log and store profile data
-        logger.debug(f"Retrieved profile data for {username}: {profile_data}")
-
-        influencer = Influencer.query.filter_by(username=username).first()
-        if influencer:
-            influencer.followers = profile.follower_count
-            influencer.following = profile.following_count
-            influencer.updated_at = datetime.utcnow()
-        else:
-            influencer = Influencer(
-                username=profile.username,
-                followers=profile.follower_count,
-                following=profile.following_count,
-                updated_at=datetime.utcnow()
-            )
-            db.session.add(influencer)
+    except Exception as e:
+        payload, status = profile_error(username, e)
+        return jsonify(payload), status
 
-        db.session.commit()
-        logger.info(f"Profile data for {username} has been stored/updated in the database.")
+@api.route('/otp/<otp_id>', methods=['GET'])
+def get_otp_status(otp_id):
+    try:
+        otp_message = otp_outbox.get(otp_id)
+        if otp_message is None:
+            return jsonify({'error': 'OTP not found.'}), 404
+        return jsonify(otp_message), 200
+    except Exception as e:
+        logger.error(f"An unexpected error occurred in get_otp_status: {str(e)}")
+        return jsonify({'error': 'An unexpected error occurred.'}), 500
 
-        return jsonify(profile_data), 200
+@api.route('/otp/verify', methods=['POST'])
+def verify_otp():
+    data = request.get_json(silent=True) or {}
+    username = data.get('username')
+    otp = data.get('otp')
+    if not username or otp is None:
+        return jsonify({'error': 'username and otp are required'}), 400
 
-    except instagrapi.exceptions.UserNotFound:
-        logger.warning(f"User {username} not found.")
-        return jsonify({'error': 'User not found.'}), 404
-    except instagrapi.exceptions.ClientError as e:
-        logger.error(f"Client error: {str(e)}")
-        return jsonify({'error': 'A client error occurred.'}), 400
+    try:
+        verified, reason = otp_outbox.verify(username, otp)
+        if not verified:
+            return jsonify({'verified': False, 'error': reason}), 400
+        return jsonify({'verified': True}), 200
     except Exception as e:
-        logger.error(f"An unexpected error occurred in get_profile: {str(e)}")
+        logger.error(f"An unexpected error occurred in verify_otp: {str(e)}")
         return jsonify({'error': 'An unexpected error occurred.'}), 500
 
-@app.route('/profileSearch', methods=['GET'])
+@api.route('/profileSearch', methods=['GET'])
 def get_profileSearch():
     username = request.args.get('username')
 
@@ -151,145 +328,460 @@ def get_profileSearch():
 
     try:
         # Load the profile
-        profile = client.user_info_by_username(username)
-
-        # Prepare the profile data
-        profile_data = {
-            'username': profile.username,
-            'full_name': profile.full_name,
-            'bio': profile.biography,
-            'followers': profile.follower_count,
-            'following': profile.following_count,
-            'posts': profile.media_count,
-            'is_business': profile.is_business,
-            'email': profile.public_email,
-            'phone_number': profile.contact_phone_number,
-            'category': profile.category,
-        }
+        profile = fetch_user_info(username, bypass=cache_bypass_requested())
 
-        # Fetch profile picture
-        profile_pic_response = requests.get(profile.profile_pic_url)
-        profile_pic_base64 = base64.b64encode(profile_pic_response.content).decode('utf-8')
-        profile_data['profile_pic_base64'] = profile_pic_base64
+        # Fetch profile picture, unless ?fields= leaves it out
+        fields = requested_fields()
+        pic_data = wanted_pic_fields(profile.profile_pic_url, request.args.get('pic'), fields)
 
-        # Log and store profile data
-        logger.debug(f"Retrieved profile data for {username}: {profile_data}")
+        return jsonify(profile_response(username, profile, pic_data, fields)), 200
 
-        influencer = Influencer.query.filter_by(username=username).first()
-        if influencer:
-            influencer.followers = profile.follower_count
-            influencer.following = profile.following_count
-            influencer.updated_at = datetime.utcnow()
+    except Exception as e:
+        payload, status = profile_error(username, e)
+        return jsonify(payload), status
+
+BATCH_MAX_USERNAMES = int(os.getenv('BATCH_MAX_USERNAMES', '300'))
+
+def _batch_profile_entry(username, profile, source, pic_mode=None, fields=None):
+    profile_data = profile_fields(profile)
+    if pic_mode:
+        profile_data.update(wanted_pic_fields(profile.profile_pic_url, pic_mode, fields))
+    return {'username': username, 'status': 'success', 'source': source, 'profile': project(profile_data, fields)}
+
+def _batch_profile_entries(usernames, max_age=None, pic_mode=None, bypass=False, fields=None):
+    """Yields one entry per username: cache hits, then fresh DB rows, then upstream fetches."""
+    misses = []
+    for username in usernames:
+        profile = None if bypass else cache.peek('profile', username)
+        if profile is not None:
+            yield _batch_profile_entry(username, profile, 'cache', pic_mode, fields)
+        else:
+            misses.append(username)
+
+    # Rows refreshed within max_age seconds are good enough and cost no upstream budget
+    if max_age and misses and not bypass:
+        cutoff = datetime.utcnow() - timedelta(seconds=max_age)
+        fresh = Influencer.query.filter(Influencer.username.in_(misses), Influencer.updated_at >= cutoff).all()
+        for influencer in fresh:
+            yield {
+                'username': influencer.username,
+                'status': 'success',
+                'source': 'db',
+                'profile': project({
+                    'username': influencer.username,
+                    'followers': influencer.followers,
+                    'following': influencer.following,
+                    'updated_at': influencer.updated_at.isoformat(),
+                }, fields),
+            }
+        served = {influencer.username for influencer in fresh}
+        misses = [username for username in misses if username not in served]
+
+    def lookup(username):
+        return fetch_user_info(username, bypass=bypass)
+
+    fetched = []
+    for _, username, profile, error in fan_out(lookup, misses):
+        if error is None:
+            fetched.append(profile)
+            try:
+                yield _batch_profile_entry(username, profile, 'upstream', pic_mode, fields)
+            except Exception as e:
+                yield {'username': username, 'status': 'error', 'error': str(e)}
+        elif isinstance(error, instagrapi.exceptions.UserNotFound):
+            yield {'username': username, 'status': 'not_found', 'error': 'User not found.'}
+        else:
+            logger.warning(f"Batch lookup for {username} failed: {str(error)}")
+            yield {'username': username, 'status': 'error', 'error': str(error)}
+
+    # One upsert for the whole batch instead of one commit per profile
+    if fetched:
+        now = datetime.utcnow()
+        rows = {
+            profile.username: {
+                'username': profile.username,
+                'followers': profile.follower_count,
+                'following': profile.following_count,
+                'updated_at': now,
+            }
+            for profile in fetched
+        }
+        try:
+            bulk_upsert_influencers(list(rows.values()))
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Bulk influencer upsert failed, deferring to write-behind: {str(e)}")
+            for profile in fetched:
+                queue_influencer_update(profile)
         else:
-            influencer = Influencer(
-                username=profile.username,
-                followers=profile.follower_count,
-                following=profile.following_count,
-                updated_at=datetime.utcnow()
-            )
-            db.session.add(influencer)
+            for profile in fetched:
+                queue_snapshot(profile)
 
-        db.session.commit()
-        logger.info(f"Profile data for {username} has been stored/updated in the database.")
+@api.route('/profiles/batch', methods=['POST'])
+def get_profiles_batch():
+    data = request.get_json(silent=True) or {}
+    usernames = data.get('usernames')
+    if not isinstance(usernames, list) or not all(isinstance(u, str) and u for u in usernames):
+        return jsonify({'error': 'Invalid request body. "usernames" must be a list of usernames.'}), 400
 
-        return jsonify(profile_data), 200
+    # Instagram usernames are case-insensitive; drop duplicates but keep request order
+    usernames = list(dict.fromkeys(u.strip().lstrip('@').lower() for u in usernames))
+    if len(usernames) > BATCH_MAX_USERNAMES:
+        return jsonify({'error': f'At most {BATCH_MAX_USERNAMES} usernames per batch.'}), 400
 
-    except instagrapi.exceptions.UserNotFound:
-        logger.warning(f"User {username} not found.")
-        return jsonify({'error': 'User not found.'}), 404
-    except instagrapi.exceptions.ClientError as e:
-        logger.error(f"Client error: {str(e)}")
-        return jsonify({'error': 'A client error occurred.'}), 400
+    try:
+        max_age = float(data['max_age']) if data.get('max_age') is not None else None
+    except (TypeError, ValueError):
+        return jsonify({'error': 'max_age must be a number of seconds.'}), 400
+
+    # Profile fields to return, as a "fields" list in the body or ?fields=
+    fields = frozenset(data['fields']) if isinstance(data.get('fields'), list) else requested_fields()
+
+    entries = _batch_profile_entries(
+        usernames,
+        max_age=max_age,
+        pic_mode=data.get('pic'),
+        bypass=bool(data.get('nocache')) or cache_bypass_requested(),
+        fields=fields,
+    )
+
+    try:
+        if data.get('stream') or stream_requested():
+            lines = (dumps(entry) + "\n" for entry in entries)
+            return Response(stream_with_context(lines), mimetype='application/x-ndjson'), 200
+
+        by_username = {entry['username']: entry for entry in entries}
+        result = [by_username.get(username) or {'username': username, 'status': 'error', 'error': 'No result.'}
+                  for username in usernames]
+        failed = sum(1 for entry in result if entry['status'] != 'success')
+        status = "success" if not failed else "partial" if failed < len(result) else "error"
+        return jsonify({"status": status, "data": result}), 200
     except Exception as e:
-        logger.error(f"An unexpected error occurred in get_profile: {str(e)}")
-        return jsonify({'error': 'An unexpected error occurred.'}), 500
-       
-@app.route('/profile/stats', methods=['GET'])
+        logger.error(f"An unexpected error occurred in get_profiles_batch: {str(e)}")
+        return jsonify({'error': 'An unexpected error occurred.', 'details': str(e)}), 500
+
+@api.route('/profile/stats', methods=['GET'])
 def get_profile_stats():
     username = request.args.get('username')  # Get username from query parameters
 
     if not username:
         return jsonify({'error': 'Username is required'}), 400
 
+    window = request.args.get('window')
     try:
-        # Load the profile
-        profile = client.user_info_by_username(username)
+        max_posts = min(int(window), STATS_MAX_WINDOW) if window else STATS_DEFAULT_WINDOW
+        if max_posts < 1:
+            raise ValueError
+    except ValueError:
+        return jsonify({'error': f'window must be an integer between 1 and {STATS_MAX_WINDOW}'}), 400
 
-        # Get recent media and calculate average likes
-        total_likes = 0
-        total_posts = 0
-        max_posts = 10  # Limit to the most recent 10 posts
+    try:
+        # Load the profile
+        profile = fetch_user_info(username, bypass=cache_bypass_requested())
 
-        media = client.user_medias(profile.pk, amount=max_posts)
-        for post in media:
-            total_likes += post.like_count
-            total_posts += 1
-            time.sleep(0.5)  # Delay to prevent rapid requests
+        # Analytics over the most recent max_posts posts, cached per (user, window)
+        load_medias = lambda amount: fetch_user_medias(profile.pk, amount, bypass=cache_bypass_requested())
+        analytics = profile_stats(profile, max_posts, load_medias, bypass=cache_bypass_requested())
 
-        average_likes = total_likes / total_posts if total_posts > 0 else 0
+        average_likes = analytics['likes']['mean']
         engagement_rate = (average_likes / profile.follower_count) * 100 if profile.follower_count > 0 else 0
 
         stats_data = {
             'average_likes': round(average_likes, 2),
             'engagement_rate': round(engagement_rate, 2),
         }
+        if window:
+            stats_data['window'] = max_posts
+            stats_data['analytics'] = analytics
 
         logger.debug(f"Fetched stats for {username}: {stats_data}")
+        queue_influencer_update(profile, engagement=stats_data['engagement_rate'])
 
-        return jsonify(stats_data), 200
+        return jsonify(project(stats_data, requested_fields())), 200
 
     except Exception as e:
         logger.error(f"An unexpected error occurred in get_profile_stats: {str(e)}")
         return jsonify({'error': 'An unexpected error occurred.'}), 500
     
-#fetch recent post details
-@app.route('/profile/post_interactions', methods=['GET'])
-def get_post_interactions():
-    username = request.args.get('username')  # Get username from query parameters
+def _no_progress(step, **details):
+    pass
+
+def post_interactions_header(username, bypass=False):
+    """Pk and summary of a user's most recent post, or (None, None) if they have no posts."""
+    # Attempt to load the profile information
+    profile = fetch_user_info(username, bypass=bypass)
+
+    # Fetch the most recent post, if available
+    media = fetch_user_medias(profile.pk, 1, bypass=bypass)
+
+    if not media:
+        return None, None
+
+    recent_post = media[0]
+
+    # Get location if tagged
+    #location = recent_post.location.name if recent_post.location else "No location tagged"
+
+    # Construct the post URL using the shortcode
+    post_url = f"https://www.instagram.com/p/{recent_post.code}/"  # `recent_post.code` gives the shortcode
+
+    # Prepare the data for response
+    post_interactions_data = {
+        'post_id': recent_post.pk,
+         'post_url': post_url,
+        'like_count': recent_post.like_count,
+        'comment_count': recent_post.comment_count,
+        'caption': recent_post.caption_text,  # Caption of the post
+        'media_type': 'Video' if recent_post.media_type == 2 else 'Image' if recent_post.media_type == 1 else 'Album',
+        #'location': location
+    }
+    return recent_post.pk, post_interactions_data
+
+# Keys of a post that come from its media summary rather than from the URL
+POST_SUMMARY_FIELDS = ('like_count', 'comment_count', 'caption', 'media_type', 'username', 'full_name',
+                       'profile_pic_url', 'location') + PROFILE_PIC_FIELDS
+
+def needs_post_summary(fields):
+    """True unless only URL-derived keys (or just likers/comments) were asked for."""
+    return wants(fields, *POST_SUMMARY_FIELDS)
+
+def post_header(post_pk, post_url, post=None, pic_data=None):
+    """Fields of a post before its likers and comments; post is None when the summary wasn't needed."""
+    if post is None:
+        return {'post_id': post_pk, 'post_url': str(post_url)}
+    post_data = {
+        'post_id': post_pk,
+        'post_url': str(post_url),
+        'like_count': post['like_count'],
+        'comment_count': post['comment_count'],
+        'caption': post['caption'],
+        'media_type': 'Video' if post['media_type'] == 2 else 'Image' if post['media_type'] == 1 else 'Album',
+        'username': post['username'],
+        'full_name': post['full_name'],
+        'profile_pic_url': post['profile_pic_url'],
+        'location': post['location'] or "No location tagged"
+    }
+    post_data.update(pic_data or {})
+    return post_data
+
+def post_url_error(post_url):
+    """Why post_url can't be looked up, or None if it can."""
+    if not post_url:
+        return 'Post URL is required'
+    # Validate the URL and extract its shortcode (post, reel or tv links)
+    if shortcode_from_url(post_url) is None:
+        return 'Invalid post URL format'
+    return None
+
+def _post_details_header(post_url, bypass=False, pic_mode=None, fields=None):
+    """Pk and details of the post at post_url, without likers and comments."""
+    #get  post_id from post url
+    post_pk= media_pk_from_url(post_url)
+
+    if not needs_post_summary(fields):
+        # Skip the media lookup
+        return post_pk, post_header(post_pk, post_url)
+
+    post = media_summary(post_pk, bypass=bypass)
+
+    # Fetch profile picture
+    pic_data = wanted_pic_fields(post['profile_pic_url'], pic_mode, fields)
+    #to display the img---> src={`data:image/jpeg;base64,${postdata.profile_pic_base64}`}, or src={postdata.profile_pic_cached_url} with ?pic=url
+    return post_pk, post_header(post_pk, post_url, post, pic_data)
+
+def commenter_entry(comment):
+    return comment.user.username
+
+def comment_entry(comment):
+    return {'username': comment.user.username, 'text': comment.text}
+
+def interaction_fields(comment_key, entry, likers=None, comments=None):
+    """The likers and comment_key lists (built with entry) from fetched users and comments; a list not fetched is left out."""
+    data = {}
+    if likers is not None:
+        data['likers'] = [user.username for user in likers]
+    if comments is not None:
+        data[comment_key] = [entry(comment) for comment in comments]
+    return data
+
+def _attach_interactions(data, media_pk, comment_key, comment_entry, bypass=False,
+                         progress=_no_progress, limit=None, cursor=None, fields=None):
+    """Adds likers and comments to data, either in full or as one page plus next_cursor.
+
+    A list left out of fields is not fetched at all.
+    """
+    include_likers = wants(fields, 'likers')
+    include_comments = wants(fields, comment_key)
+    if limit is None:
+        likers = comments = None
+        # Fetch the people who liked the post
+        if include_likers:
+            progress('likers')
+            likers = fetch_media_likers(media_pk, bypass=bypass)
+
+        # Fetch the comments
+        if include_comments:
+            progress('comments')
+            comments = fetch_media_comments(media_pk, bypass=bypass)
+        data.update(interaction_fields(comment_key, comment_entry, likers, comments))
+        return data
+
+    # A missing key means "start from the beginning", None means that list is exhausted
+    state = decode_cursor(cursor)
+    next_state = {'likers': None, 'comments': None}
+
+    data['likers'] = []
+    if include_likers and state.get('likers', 0) is not None:
+        progress('likers')
+        likers, next_state['likers'] = fetch_media_likers_page(media_pk, state.get('likers', 0), limit, bypass=bypass)
+        data['likers'] = [user.username for user in likers]
+
+    data[comment_key] = []
+    if include_comments and state.get('comments', '') is not None:
+        progress('comments')
+        comments, next_state['comments'] = fetch_media_comments_page(media_pk, state.get('comments') or None, limit, bypass=bypass)
+        data[comment_key] = [comment_entry(comment) for comment in comments]
+
+    data['next_cursor'] = encode_cursor(next_state)
+    return data
+
+def _interaction_lines(data, media_pk, comment_key, bypass=False, fields=None):
+    """NDJSON lines: the post itself, then each liker and comment as upstream pages arrive."""
+    yield dumps(dict(project(data, fields), type='post')) + "\n"
+    try:
+        # Instagram returns likers in one response; comments are pulled page by page
+        if wants(fields, 'likers'):
+            for user in fetch_media_likers(media_pk, bypass=bypass):
+                yield dumps({'type': 'liker', 'username': user.username}) + "\n"
+        if wants(fields, comment_key):
+            for page in iter_media_comment_pages(media_pk, DEFAULT_PAGE_SIZE):
+                for comment in page:
+                    yield dumps(dict(comment_entry(comment), type='comment')) + "\n"
+    except Exception as e:
+        logger.error(f"Interaction stream for {media_pk} failed: {str(e)}")
+        yield dumps({'type': 'error', 'error': str(e)}) + "\n"
+        return
+    yield dumps({'type': 'end'}) + "\n"
+
+# Kept even when ?fields= leaves them out, or the client couldn't page on
+PAGINATION_FIELDS = ('next_cursor',)
+
+def build_post_interactions(username, bypass=False, progress=_no_progress, limit=None, cursor=None, fields=None):
+    """Likers and commenters of a user's most recent post, or None if they have no posts."""
+    fields = frozenset(fields) if fields is not None else None
+    media_pk, post_interactions_data = post_interactions_header(username, bypass=bypass)
+    if post_interactions_data is None:
+        return None
+    _attach_interactions(post_interactions_data, media_pk, 'commenters', commenter_entry,
+                         bypass=bypass, progress=progress, limit=limit, cursor=cursor, fields=fields)
+    logger.debug(f"Retrieved post interactions for {username}: {post_interactions_data}")
+    return project(post_interactions_data, fields, always=PAGINATION_FIELDS)
+
+def build_post_details(post_url, bypass=False, pic_mode=None, progress=_no_progress, limit=None, cursor=None, fields=None):
+    """Full details of the post at post_url, including likers and comments."""
+    fields = frozenset(fields) if fields is not None else None
+    post_pk, post_data = _post_details_header(post_url, bypass=bypass, pic_mode=pic_mode, fields=fields)
+    _attach_interactions(post_data, post_pk, 'comments', comment_entry,
+                         bypass=bypass, progress=progress, limit=limit, cursor=cursor, fields=fields)
+    return project(post_data, fields, always=PAGINATION_FIELDS)
+
+# Background job handlers for the slow liker/comment harvesting endpoints
+def _post_interactions_job(context, username, bypass=False, fields=None):
+    data = build_post_interactions(username, bypass=bypass, progress=context.progress, fields=fields)
+    if data is None:
+        raise LookupError('No posts found for this user.')
+    return data
+
+def _post_details_job(context, post_url, bypass=False, pic_mode=None, fields=None):
+    return build_post_details(post_url, bypass=bypass, pic_mode=pic_mode, progress=context.progress, fields=fields)
+
+def _job_fields():
+    # Job params are stored as JSON, so the projection travels as a sorted list
+    fields = requested_fields()
+    return sorted(fields) if fields is not None else None
+
+job_queue.register('post_interactions', _post_interactions_job)
+job_queue.register('post_details', _post_details_job)
+
+def async_requested():
+    return request.args.get('async') == '1'
+
+def submit_job(job_type, params):
+    job_id = job_queue.submit(job_type, params)
+    response = jsonify({'job_id': job_id, 'status': 'queued', 'status_url': f"/jobs/{job_id}"})
+    response.headers['Location'] = f"/jobs/{job_id}"
+    return response, 202
+
+@api.route('/profile/history', methods=['GET'])
+def get_profile_history():
+    """Follower history from our own snapshots; never calls Instagram."""
+    username = request.args.get('username')
 
     if not username:
         return jsonify({'error': 'Username is required'}), 400
 
+    bucket = request.args.get('bucket', 'day')
+    if bucket not in ('day', 'week', 'raw'):
+        return jsonify({'error': 'bucket must be one of day, week or raw'}), 400
+
     try:
-        # Attempt to load the profile information
-        profile = client.user_info_by_username(username)
-        
-        # Fetch the most recent post, if available
-        media = client.user_medias(profile.pk, amount=1)
-        
-        if not media:
-            return jsonify({'error': 'No posts found for this user.'}), 404
+        end = datetime.fromisoformat(request.args['to']) if request.args.get('to') else datetime.utcnow()
+        start = datetime.fromisoformat(request.args['from']) if request.args.get('from') else end - timedelta(days=90)
+    except ValueError:
+        return jsonify({'error': 'from and to must be ISO 8601 dates'}), 400
 
-        recent_post = media[0]
-        
-        # Get likes for the recent post
-        likers = client.media_likers(recent_post.pk)
-        liker_usernames = [user.username for user in likers]
+    try:
+        history = snapshot_history(username.lower(), start, end, bucket=bucket)
+        return jsonify({
+            'username': username,
+            'bucket': bucket,
+            'from': start.isoformat(),
+            'to': end.isoformat(),
+            'points': history,
+        }), 200
+    except Exception as e:
+        logger.error(f"An unexpected error occurred in get_profile_history: {str(e)}")
+        return jsonify({'error': 'An unexpected error occurred.'}), 500
 
-        # Get comments for the recent post
-        comments = client.media_comments(recent_post.pk)
-        commenter_usernames = [comment.user.username for comment in comments]
-        
-        # Get location if tagged
-        #location = recent_post.location.name if recent_post.location else "No location tagged"
+#fetch recent post details
+@api.route('/profile/post_interactions', methods=['GET'])
+def get_post_interactions():
+    username = request.args.get('username')  # Get username from query parameters
 
-        # Construct the post URL using the shortcode
-        post_url = f"https://www.instagram.com/p/{recent_post.code}/"  # `recent_post.code` gives the shortcode
+    if not username:
+        return jsonify({'error': 'Username is required'}), 400
 
-        # Prepare the data for response
-        post_interactions_data = {
-            'post_id': recent_post.pk,
-             'post_url': post_url,
-            'like_count': recent_post.like_count,
-            'comment_count': recent_post.comment_count,
-            'likers': liker_usernames,
-            'commenters': commenter_usernames,
-            'caption': recent_post.caption_text,  # Caption of the post
-            'media_type': 'Video' if recent_post.media_type == 2 else 'Image' if recent_post.media_type == 1 else 'Album',
-            #'location': location
-        }
+    if async_requested():
+        return submit_job('post_interactions', {
+            'username': username,
+            'bypass': cache_bypass_requested(),
+            'fields': _job_fields(),
+        })
 
-        logger.debug(f"Retrieved post interactions for {username}: {post_interactions_data}")
+    try:
+        limit = parse_limit(request.args.get('limit'))
+        decode_cursor(request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        if stream_requested():
+            media_pk, post_interactions_data = post_interactions_header(username, bypass=cache_bypass_requested())
+            if post_interactions_data is None:
+                return jsonify({'error': 'No posts found for this user.'}), 404
+            lines = _interaction_lines(post_interactions_data, media_pk, 'commenters',
+                                       bypass=cache_bypass_requested(), fields=requested_fields())
+            return Response(stream_with_context(lines), mimetype='application/x-ndjson'), 200
+
+        post_interactions_data = build_post_interactions(
+            username,
+            bypass=cache_bypass_requested(),
+            limit=limit,
+            cursor=request.args.get('cursor'),
+            fields=requested_fields(),
+        )
+        if post_interactions_data is None:
+            return jsonify({'error': 'No posts found for this user.'}), 404
 
         return jsonify(post_interactions_data), 200
 
@@ -297,89 +789,160 @@ def get_post_interactions():
         logger.error(f"An unexpected error occurred in get_post_interactions: {str(e)}")
         return jsonify({'error': 'An unexpected error occurred.', 'details': str(e)}), 500
 
-@app.route('/post/details_by_url', methods=['GET'])
+@api.route('/post/details_by_url', methods=['GET'])
 def get_post_details_by_url():
     post_url = request.args.get('post_url')  # Get the post URL from query parameters
 
-    if not post_url:
-        return jsonify({'error': 'Post URL is required'}), 400
-
-    try:
-        # Extract the shortcode from the URL
-        match = re.search(r'/p/([^/]+)/', post_url)
-        if not match:
-            return jsonify({'error': 'Invalid post URL format'}), 400
-
-        shortcode = match.group(1)
-        
-        #get  post_id from post url
-        post_pk= client.media_pk_from_url(post_url)
-        print("post pk:",post_pk)
+    error = post_url_error(post_url)
+    if error:
+        return jsonify({'error': error}), 400
 
-        
-        post = client.media_info(post_pk)
-        print("post details:",post)
-        
-        # Prepare the data for response
-        post_data = {
-            'post_id': post_pk,
-            'post_url': str(post_url),
-            'like_count': post.like_count,
-            'comment_count': post.comment_count,
-            'caption': post.caption_text,
-            'media_type': 'Video' if post.media_type == 2 else 'Image' if post.media_type == 1 else 'Album',
-            'username': post.user.username,
-            'full_name': post.user.full_name,
-            'profile_pic_url': str(post.user.profile_pic_url),
-            'location': post.location.name if post.location else "No location tagged"
-        }
-
-        # Fetch profile picture
-        profile_pic_response = requests.get(post.user.profile_pic_url)
-        profile_pic_base64 = base64.b64encode(profile_pic_response.content).decode('utf-8')
-        post_data['profile_pic_base64'] = profile_pic_base64
-        #to display the img---> src={`data:image/jpeg;base64,${postdata.profile_pic_base64}`}
-
-        # Fetch the usernames of people who liked the post
-        likers = client.media_likers(post_pk)
-        post_data['likers'] = [user.username for user in likers]  # List of usernames of people who liked the post
+    if async_requested():
+        return submit_job('post_details', {
+            'post_url': post_url,
+            'bypass': cache_bypass_requested(),
+            'pic_mode': request.args.get('pic'),
+            'fields': _job_fields(),
+        })
 
-        # Fetch the comments and the usernames of commenters
-        comments = client.media_comments(post_pk)
-        post_data['comments'] = [
-            {'username': comment.user.username, 'text': comment.text}
-            for comment in comments
-        ]  # List of dictionaries with commenter usernames and comment text
+    try:
+        limit = parse_limit(request.args.get('limit'))
+        decode_cursor(request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
+    try:
+        if stream_requested():
+            fields = requested_fields()
+            post_pk, post_data = _post_details_header(post_url, bypass=cache_bypass_requested(),
+                                                      pic_mode=request.args.get('pic'), fields=fields)
+            lines = _interaction_lines(post_data, post_pk, 'comments', bypass=cache_bypass_requested(), fields=fields)
+            return Response(stream_with_context(lines), mimetype='application/x-ndjson'), 200
+
+        post_data = build_post_details(
+            post_url,
+            bypass=cache_bypass_requested(),
+            pic_mode=request.args.get('pic'),
+            limit=limit,
+            cursor=request.args.get('cursor'),
+            fields=requested_fields(),
+        )
         return jsonify(post_data), 200
 
     except Exception as e:
         logger.error(f"An unexpected error occurred in get_post_details_by_url: {str(e)}")
         return jsonify({'error': 'An unexpected error occurred.', 'details': str(e)}), 500
-    
-@app.route("/fetch_post_stats", methods=['POST'])
+
+@api.route('/jobs', methods=['POST'])
+def create_job():
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data.get('params'), dict):
+        return jsonify({'error': 'Invalid request body. "params" must be an object.'}), 400
+    try:
+        return submit_job(data.get('type'), data['params'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@api.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found.'}), 404
+    return jsonify(job), 200
+
+@api.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    if job_queue.status(job_id) is None:
+        return jsonify({'error': 'Job not found.'}), 404
+    if not job_queue.cancel(job_id):
+        return jsonify({'error': 'Job has already finished.'}), 409
+    return jsonify({'job_id': job_id, 'status': 'cancelled'}), 200
+
+@api.route('/jobs/<job_id>/stream', methods=['GET'])
+def stream_job(job_id):
+    """NDJSON feed of job state, one line per change, ending once the job finishes."""
+    if job_queue.status(job_id) is None:
+        return jsonify({'error': 'Job not found.'}), 404
+
+    def generate():
+        last_seen = None
+        while True:
+            job = job_queue.get(job_id)
+            if job is None:
+                return
+            if job['updated_at'] != last_seen:
+                last_seen = job['updated_at']
+                yield dumps(job) + "\n"
+            if job['status'] in FINISHED_STATUSES:
+                return
+            time.sleep(0.5)
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def _fetch_single_post_stats(item, flask_app, bypass=False):
+    url, media_pk = item
+    # Runs on a fan-out thread, which needs its own app context for the media store
+    with flask_app.app_context():
+        media = media_summary(media_pk, bypass=bypass)
+    return {
+        "url": url,
+        "likes": media['like_count'],
+        "comments": media['comment_count'],
+    }
+
+def _post_stats_entries(urls, max_workers, timeout, bypass=False):
+    """Yields one success or error entry per URL as each lookup finishes."""
+    # Resolve every URL to a media pk locally in one pass; malformed URLs fail fast
+    pks = media_pks_from_urls(urls)
+    items = []
+    for index, (url, media_pk) in enumerate(zip(urls, pks)):
+        if media_pk is None:
+            yield {"index": index, "url": url, "status": "error", "error": "Invalid post URL format"}
+        else:
+            items.append((index, url, media_pk))
+
+    lookup = functools.partial(_fetch_single_post_stats, flask_app=current_app._get_current_object(), bypass=bypass)
+    for position, (url, _), stats, error in fan_out(lookup, [(url, pk) for _, url, pk in items], max_workers=max_workers, timeout=timeout):
+        index = items[position][0]
+        if error is not None:
+            logger.warning(f"Failed to fetch post stats for {url}: {str(error)}")
+            yield {"index": index, "url": url, "status": "error", "error": str(error)}
+        else:
+            yield dict(stats, index=index, status="success")
+
+@api.route("/fetch_post_stats", methods=['POST'])
 def fetch_post_stats():
-    data = request.get_json()  # Get JSON payload
+    data = request.get_json(silent=True) or {}  # Get JSON payload
     try:
-        result = []
         if 'urls' not in data or not isinstance(data['urls'], list):
             return jsonify({'error': 'Invalid request body. "urls" must be a list.'}), 400
-        
-        for url in data['urls']:  
-            media_pk = client.media_pk_from_url(url)
-            media= client.media_info(media_pk)
-            stats = {
-                "url": url,
-                "likes": media.like_count,
-                "comments": media.comment_count,
-            }
-            result.append(stats)
-        return jsonify({"status": "success", "data": result}), 200
+
+        # Per-batch concurrency and item timeout can be lowered by the caller but never raised past the server caps
+        max_workers = max(1, min(int(data.get('max_concurrency', FANOUT_MAX_WORKERS)), FANOUT_MAX_WORKERS))
+        timeout = float(data.get('timeout', FANOUT_ITEM_TIMEOUT))
+        if not 0 < timeout < float('inf'):
+            raise ValueError("timeout must be a positive number of seconds")
+        timeout = min(timeout, FANOUT_ITEM_TIMEOUT)
+        stream = data.get('stream') or stream_requested()
+
+        entries = _post_stats_entries(data['urls'], max_workers, timeout, bypass=cache_bypass_requested())
+
+        if stream:
+            # NDJSON: one line per URL, flushed as soon as its lookup completes
+            lines = (dumps(entry) + "\n" for entry in entries)
+            return Response(stream_with_context(lines), mimetype='application/x-ndjson'), 200
+
+        result = sorted(entries, key=lambda entry: entry['index'])
+        failed = sum(1 for entry in result if entry['status'] == 'error')
+        status = "success" if not failed else "partial" if failed < len(result) else "error"
+        return jsonify({"status": status, "data": result}), 200
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': 'Invalid request body.', 'details': str(e)}), 400
     except Exception as e:
         logger.error(f"An unexpected error occurred while getting no of likes and comments: {str(e)}")
         return jsonify({'error': 'An unexpected error occurred.', 'details': str(e)}), 500
 
-@app.route('/postDetails_by_url', methods=['GET'])
+@api.route('/postDetails_by_url', methods=['GET'])
 def get_postDetails_by_url():
     post_url = request.args.get('post_url')  # Get the post URL from query parameters
 
@@ -387,32 +950,126 @@ def get_postDetails_by_url():
         return jsonify({'error': 'Post URL is required'}), 400
 
     try:
-        # Extract the shortcode from the URL
-        match = re.search(r'/p/([^/]+)/', post_url)
-        if not match:
+        # Validate the URL and extract its shortcode (post, reel or tv links)
+        if shortcode_from_url(post_url) is None:
             return jsonify({'error': 'Invalid post URL format'}), 400
-
-        shortcode = match.group(1)
         
         #get  post_id from post url
-        post_pk= client.media_pk_from_url(post_url)
-        print("post pk:",post_pk)
+        post_pk= media_pk_from_url(post_url)
 
         
-        post = client.media_info(post_pk)
-        print("post details:",post)
+        # Owner fields never change, so a post we have seen before is answered from the store
+        post = media_summary(post_pk, counts=False, bypass=cache_bypass_requested())
+        logger.debug(f"Post details for {post_pk}: {post}")
         
         # Prepare the data for response
         post_data = {
-            'username': post.user.username,
-            'full_name': post.user.full_name,
+            'username': post['username'],
+            'full_name': post['full_name'],
         }
 
-        return jsonify(post_data), 200
+        return jsonify(project(post_data, requested_fields())), 200
 
     except Exception as e:
         logger.error(f"An unexpected error occurred in get_post_details_by_url: {str(e)}")
         return jsonify({'error': 'An unexpected error occurred.', 'details': str(e)}), 500
         
+# Background workers start lazily, in the process that serves requests. Under gunicorn's
+# preload_app the master only imports this module, so no thread is lost across the fork.
+_background_lock = threading.Lock()
+_background_started = False
+
+def start_background(flask_app):
+    """Starts the write-behind flushers, job workers and scheduler once per process."""
+    global _background_started
+    if _background_started:
+        return
+    with _background_lock:
+        if _background_started:
+            return
+        if DB_AUTO_CREATE:
+            with flask_app.app_context():
+                db.create_all()
+        influencer_writer.start(flask_app)
+        snapshot_writer.start(flask_app)
+        job_queue.start(flask_app)
+        otp_outbox.start(flask_app)
+        if SCHEDULER_ENABLED:
+            refresh_scheduler.start(flask_app)
+        _background_started = True
+
+@api.before_app_request
+def ensure_background_started():
+    start_background(current_app._get_current_object())
+
+@api.route('/health', methods=['GET'])
+def get_health():
+    # Liveness only; never touches the database or Instagram
+    return jsonify({'status': 'ok'}), 200
+
+@api.route('/ready', methods=['GET'])
+def get_readiness():
+    checks = {}
+    try:
+        db.session.execute(text('SELECT 1'))
+        checks['database'] = 'ok'
+    except Exception as e:
+        logger.warning(f"Readiness check: database unavailable: {str(e)}")
+        checks['database'] = 'unavailable'
+    try:
+        pool_stats = get_session_pool().stats()
+        checks['sessions'] = 'ok' if pool_stats['quarantined'] < pool_stats['size'] else 'all sessions quarantined'
+    except Exception as e:
+        logger.warning(f"Readiness check: session pool unavailable: {str(e)}")
+        checks['sessions'] = 'unavailable'
+    checks['background'] = 'ok' if _background_started else 'not started'
+
+    ready = all(status == 'ok' for status in checks.values())
+    return jsonify({'ready': ready, 'checks': checks}), 200 if ready else 503
+
+def create_app():
+    """Builds the Flask application without touching the database or Instagram.
+
+    The DB engine is created on first query and the Instagram sessions on
+    first upstream call, so building the app only costs the imports.
+    """
+    database_url = os.getenv('NEON_DB_URL')
+    if not database_url:
+        logger.error("NeonDB URL not set in environment variables.")
+        raise ValueError("NEON_DB_URL is required.")
+
+    flask_app = Flask(__name__)
+    CORS(flask_app)
+
+    # Per-route latency, status and in-flight metrics, plus ?profile=1 stack sampling
+    metrics.instrument_app(flask_app)
+
+    # Strong ETags, If-None-Match 304s and gzip/brotli negotiation for every JSON and text response
+    responses.install(flask_app)
+
+    flask_app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    flask_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    # Connection pool tuning; pre-ping and recycle keep Neon's idle-closed connections from surfacing as errors
+    flask_app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', '1') == '1',
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', '300')),
+    }
+    if not database_url.startswith('sqlite'):
+        flask_app.config['SQLALCHEMY_ENGINE_OPTIONS'].update({
+            'pool_size': int(os.getenv('DB_POOL_SIZE', '5')),
+            'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', '10')),
+            'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', '30')),
+        })
+
+    # Initialize SQLAlchemy, timing every statement for /metrics
+    db.init_app(flask_app)
+    metrics.instrument_sqlalchemy()
+
+    flask_app.register_blueprint(api)
+    return flask_app
+
+app = create_app()
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
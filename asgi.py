@@ -0,0 +1,387 @@
+import io
+import os
+import sys
+import time
+import asyncio
+import logging
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+import httpx
+from dotenv import load_dotenv
+
+import app as routes
+import images
+import metrics
+from mediastore import media_summary
+from responses import parse_fields, wants, project
+from upstream import media_pk_from_url, fetch_user_info, fetch_media_likers, fetch_media_comments
+
+# Optional asyncio serving mode, next to the WSGI app in app.py. Run it with an ASGI server
+# (pip install uvicorn httpx):
+#
+#     uvicorn asgi:app --host 0.0.0.0 --port 8000 --workers 4
+#
+# The single-request lookups below run natively on the event loop, so a waiting request costs
+# a coroutine rather than a thread, and the upstream calls one response needs that don't depend
+# on each other are made at the same time. The response bodies are built by the same helpers
+# as the Flask views, and sent through the Flask app's response handling (CORS, ETags,
+# compression). Every other route, and the paginated, streamed and ?async=1 variants of
+# these, is served by the Flask app on a thread pool.
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Concurrency limits, overridable from the environment. instagrapi is blocking, so its calls
+# (and the database work around them) run on a bounded pool; requests beyond that wait on the
+# loop without holding a thread.
+ASGI_UPSTREAM_WORKERS = int(os.getenv('ASGI_UPSTREAM_WORKERS', '64'))
+ASGI_WSGI_WORKERS = int(os.getenv('ASGI_WSGI_WORKERS', '16'))
+ASGI_HTTP_MAX_CONNECTIONS = int(os.getenv('ASGI_HTTP_MAX_CONNECTIONS', '100'))
+# Body chunks a Flask response may get ahead of a slow client before its thread waits
+ASGI_STREAM_BUFFER = int(os.getenv('ASGI_STREAM_BUFFER', '16'))
+
+# Query parameters only the Flask routes implement
+WSGI_ONLY_PARAMS = frozenset(('async', 'stream', 'limit', 'cursor', 'profile'))
+
+flask_app = routes.app
+
+upstream_executor = ThreadPoolExecutor(max_workers=ASGI_UPSTREAM_WORKERS, thread_name_prefix='asgi-upstream')
+wsgi_executor = ThreadPoolExecutor(max_workers=ASGI_WSGI_WORKERS, thread_name_prefix='asgi-wsgi')
+
+# Created on first use, inside the event loop that owns it
+_http = None
+
+
+def http_client():
+    """Keep-alive async client for the CDN, sized like the images.py requests pool."""
+    global _http
+    if _http is None:
+        connect_timeout, read_timeout = images.IMAGE_FETCH_TIMEOUT
+        limits = httpx.Limits(max_connections=ASGI_HTTP_MAX_CONNECTIONS, max_keepalive_connections=images.IMAGE_POOL_SIZE)
+        _http = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            transport=httpx.AsyncHTTPTransport(limits=limits, retries=1),
+        )
+    return _http
+
+
+def _in_app_context(fn, args, kwargs):
+    with flask_app.app_context():
+        return fn(*args, **kwargs)
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """Runs a blocking call (instagrapi, SQLAlchemy) on the upstream pool, inside an app context."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(upstream_executor, functools.partial(_in_app_context, fn, args, kwargs))
+
+
+async def pic_fields(url, mode, fields):
+    """Async wanted_pic_fields: the picture is downloaded through httpx."""
+    if not wants(fields, *routes.PROFILE_PIC_FIELDS):
+        return {}
+    try:
+        content_hash = await images.fetch_image_async(url, http_client())
+        return images.pic_fields_for_hash(content_hash, mode)
+    except images.PIC_FETCH_ERRORS + (httpx.HTTPError,) as e:
+        logger.warning(f"Profile picture {url} could not be fetched: {str(e)}")
+        return images.missing_pic_fields(mode)
+
+
+async def interactions(media_pk, comment_key, entry, bypass, fields):
+    """Likers and comments of a post, fetched side by side. A list left out of fields is not fetched."""
+    async def likers():
+        if not wants(fields, 'likers'):
+            return None
+        return await run_blocking(fetch_media_likers, media_pk, bypass=bypass)
+
+    async def comments():
+        if not wants(fields, comment_key):
+            return None
+        return await run_blocking(fetch_media_comments, media_pk, bypass=bypass)
+
+    liker_list, comment_list = await asyncio.gather(likers(), comments())
+    return routes.interaction_fields(comment_key, entry, liker_list, comment_list)
+
+
+# Handlers take the query parameters and return (status, payload), like the Flask views they mirror
+async def get_profile(query, send_otp=True):
+    username = query.get('username')
+
+    if not username:
+        return 400, {'error': 'Username is required'}
+
+    try:
+        profile = await run_blocking(fetch_user_info, username, bypass=query.get('nocache') == '1')
+
+        fields = parse_fields(query.get('fields'))
+        if send_otp:
+            # The picture download and the OTP insert don't depend on each other. A repeat
+            # after a failed picture reuses the queued OTP, as the outbox deduplicates.
+            pic_data, otp_data = await asyncio.gather(
+                pic_fields(profile.profile_pic_url, query.get('pic'), fields),
+                run_blocking(routes.queue_otp, profile),
+            )
+        else:
+            pic_data = await pic_fields(profile.profile_pic_url, query.get('pic'), fields)
+            otp_data = None
+        return 200, routes.profile_response(username, profile, pic_data, fields, otp_data)
+
+    except Exception as e:
+        payload, status = routes.profile_error(username, e)
+        return status, payload
+
+
+async def get_profileSearch(query):
+    return await get_profile(query, send_otp=False)
+
+
+async def get_post_interactions(query):
+    username = query.get('username')
+
+    if not username:
+        return 400, {'error': 'Username is required'}
+
+    bypass = query.get('nocache') == '1'
+    fields = parse_fields(query.get('fields'))
+    try:
+        # Profile then most recent post is a true chain; only the lists after it can overlap
+        media_pk, post_interactions_data = await run_blocking(routes.post_interactions_header, username, bypass=bypass)
+        if post_interactions_data is None:
+            return 404, {'error': 'No posts found for this user.'}
+
+        post_interactions_data.update(
+            await interactions(media_pk, 'commenters', routes.commenter_entry, bypass, fields))
+        return 200, project(post_interactions_data, fields, always=routes.PAGINATION_FIELDS)
+
+    except Exception as e:
+        logger.error(f"An unexpected error occurred in get_post_interactions: {str(e)}")
+        return 500, {'error': 'An unexpected error occurred.', 'details': str(e)}
+
+
+async def get_post_details_by_url(query):
+    post_url = query.get('post_url')
+
+    error = routes.post_url_error(post_url)
+    if error:
+        return 400, {'error': error}
+
+    bypass = query.get('nocache') == '1'
+    fields = parse_fields(query.get('fields'))
+    post_pk = media_pk_from_url(post_url)
+
+    async def header():
+        if not routes.needs_post_summary(fields):
+            return routes.post_header(post_pk, post_url)
+        post = await run_blocking(media_summary, post_pk, bypass=bypass)
+        pic_data = await pic_fields(post['profile_pic_url'], query.get('pic'), fields)
+        return routes.post_header(post_pk, post_url, post, pic_data)
+
+    try:
+        # The likers and comments only need the pk, which comes from the URL, so they run
+        # alongside the summary and picture instead of after them
+        post_data, interaction_data = await asyncio.gather(
+            header(), interactions(post_pk, 'comments', routes.comment_entry, bypass, fields))
+        post_data.update(interaction_data)
+        return 200, project(post_data, fields, always=routes.PAGINATION_FIELDS)
+
+    except Exception as e:
+        logger.error(f"An unexpected error occurred in get_post_details_by_url: {str(e)}")
+        return 500, {'error': 'An unexpected error occurred.', 'details': str(e)}
+
+
+ROUTES = {
+    '/profile': get_profile,
+    '/profileSearch': get_profileSearch,
+    '/profile/post_interactions': get_post_interactions,
+    '/post/details_by_url': get_post_details_by_url,
+}
+
+
+def _request_headers(scope):
+    headers = {}
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').lower()
+        value = value.decode('latin-1')
+        headers[name] = f"{headers[name]},{value}" if name in headers else value
+    return headers
+
+
+def _finalize_json(scope, status, payload):
+    """(status, headers, body) of payload after the Flask app's after-request handlers."""
+    with flask_app.request_context(_wsgi_environ(scope, b'')):
+        response = flask_app.process_response(flask_app.make_response((routes.jsonify(payload), status)))
+        body = response.get_data()
+    headers = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in response.headers.items()]
+    return response.status_code, headers, body
+
+
+async def send_json(scope, send, status, payload):
+    """Sends payload through the Flask app's after-request handlers, so CORS, ETags and
+    compression match the WSGI routes. Returns the status sent.
+
+    Encoding, hashing and compressing a body with thousands of likers takes a while, so it
+    runs on the upstream pool rather than stalling every other request on the loop.
+    """
+    status, headers, body = await run_blocking(_finalize_json, scope, status, payload)
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+    return status
+
+
+async def serve_route(handler, scope, send):
+    routes.start_background(flask_app)
+    route = scope['path']
+    query = {}
+    for name, value in parse_qsl(scope['query_string'].decode('utf-8', 'replace'), keep_blank_values=True):
+        # Like request.args.get, the first value wins
+        query.setdefault(name, value)
+    if not WSGI_ONLY_PARAMS.isdisjoint(query):
+        return False
+
+    metrics.http_in_flight.inc(route=route)
+    start = time.perf_counter()
+    try:
+        status, payload = await handler(query)
+        status = await send_json(scope, send, status, payload)
+    finally:
+        metrics.http_in_flight.dec(route=route)
+    metrics.http_latency.observe(time.perf_counter() - start, route=route, method='GET')
+    metrics.http_requests.inc(route=route, method='GET', status=str(status))
+    return True
+
+
+def _wsgi_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in _request_headers(scope).items():
+        key = name.upper().replace('-', '_')
+        if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = f"HTTP_{key}"
+        environ[key] = value
+    return environ
+
+
+async def call_wsgi(scope, receive, send):
+    """Serves the request with the Flask app on the WSGI pool, streaming its body back."""
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            break
+
+    environ = _wsgi_environ(scope, bytes(body))
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=ASGI_STREAM_BUFFER)
+    # Set once nothing reads the queue any more, so the producer stops instead of waiting on it
+    closed = threading.Event()
+
+    def put(item):
+        # Blocks the pool thread while the client is behind
+        if not closed.is_set():
+            asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    def start_response(status, headers, exc_info=None):
+        put(('start', int(status.split(' ', 1)[0]), headers))
+        return lambda data: put(('body', data))
+
+    def respond():
+        # Produce the whole response on one thread: stream_with_context keeps the request
+        # context in thread-local state, so an NDJSON generator can't hop between threads
+        try:
+            iterable = flask_app(environ, start_response)
+            try:
+                for chunk in iterable:
+                    if closed.is_set():
+                        break
+                    if chunk:
+                        put(('body', chunk))
+            finally:
+                if hasattr(iterable, 'close'):
+                    iterable.close()
+        finally:
+            put(('end',))
+
+    future = loop.run_in_executor(wsgi_executor, respond)
+    started = False
+    try:
+        while True:
+            item = await queue.get()
+            if item[0] == 'start' and not started:
+                headers = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in item[2]]
+                await send({'type': 'http.response.start', 'status': item[1], 'headers': headers})
+                started = True
+            elif item[0] == 'body':
+                await send({'type': 'http.response.body', 'body': item[1], 'more_body': True})
+            elif item[0] == 'end':
+                break
+    finally:
+        if not future.done():
+            # The client went away mid-response: release a put waiting for room, and any after it return at once
+            closed.set()
+            while not queue.empty():
+                queue.get_nowait()
+
+    try:
+        await future
+    except Exception as e:
+        logger.error(f"WSGI request {scope['path']} failed: {str(e)}")
+        if not started:
+            await send({'type': 'http.response.start', 'status': 500,
+                        'headers': [(b'content-type', b'text/plain; charset=utf-8')]})
+            await send({'type': 'http.response.body', 'body': b'Internal Server Error'})
+            return
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            routes.start_background(flask_app)
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if _http is not None:
+                await _http.aclose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    """ASGI entry point."""
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        raise RuntimeError(f"Unsupported ASGI scope type: {scope['type']}")
+
+    handler = ROUTES.get(scope['path']) if scope['method'] == 'GET' else None
+    if handler is not None and await serve_route(handler, scope, send):
+        return
+    await call_wsgi(scope, receive, send)
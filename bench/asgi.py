@@ -0,0 +1,8 @@
+import sessionpool
+from bench.fakeclient import FakeClient
+
+# uvicorn entry point (bench.asgi:app) serving asgi.py against the fake Instagram client,
+# swapped in before app.py is imported exactly as in bench/wsgi.py.
+sessionpool.Client = FakeClient
+
+from asgi import app  # noqa: E402
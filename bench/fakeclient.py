@@ -0,0 +1,193 @@
+import os
+import math
+import time
+import random
+import hashlib
+from datetime import datetime, timedelta
+
+from instagrapi.exceptions import ClientError, PleaseWaitFewMinutes, UserNotFound
+from instagrapi.types import Account, Comment, Location, Media, User, UserShort
+
+from urls import SHORTCODE_ALPHABET
+
+# Latency and failure model, read from the environment so gunicorn workers pick it up.
+# Per-method overrides use the upper-cased method name, e.g. BENCH_LATENCY_MS_MEDIA_LIKERS=400.
+BENCH_LATENCY_MS = float(os.getenv('BENCH_LATENCY_MS', '150'))
+# Spread of the lognormal latency distribution; 0 makes every call take exactly the median
+BENCH_LATENCY_SIGMA = float(os.getenv('BENCH_LATENCY_SIGMA', '0.5'))
+BENCH_ERROR_RATE = float(os.getenv('BENCH_ERROR_RATE', '0.01'))
+BENCH_THROTTLE_RATE = float(os.getenv('BENCH_THROTTLE_RATE', '0'))
+BENCH_IMAGE_URL = os.getenv('BENCH_IMAGE_URL', 'http://127.0.0.1:8765')
+BENCH_LIKERS = int(os.getenv('BENCH_LIKERS', '200'))
+BENCH_COMMENTS = int(os.getenv('BENCH_COMMENTS', '60'))
+
+# Fake media pks are owner_pk * MEDIA_PK_STRIDE + index, so any pk maps back to its owner
+MEDIA_PK_STRIDE = 100000
+EPOCH = datetime(2024, 1, 1)
+
+
+def shortcode_from_pk(media_pk):
+    """Inverse of urls.pk_from_shortcode, for building post URLs of fake media."""
+    media_pk = int(media_pk)
+    code = ''
+    while media_pk:
+        media_pk, digit = divmod(media_pk, 64)
+        code = SHORTCODE_ALPHABET[digit] + code
+    return code or 'A'
+
+
+def username_for(user_pk):
+    return f"user{int(user_pk):05d}"
+
+
+def user_pk_for(username):
+    """Fake users are named userNNNNN; anything else resolves to a stable hashed pk."""
+    if username.startswith('user') and username[4:].isdigit():
+        return int(username[4:])
+    return int(hashlib.sha1(username.encode()).hexdigest()[:8], 16)
+
+
+def _rng(*seed):
+    return random.Random(':'.join(str(part) for part in seed))
+
+
+def _env_float(name, method, default):
+    value = os.getenv(f"{name}_{method.upper()}")
+    return float(value) if value is not None else default
+
+
+class FakeClient:
+    """Stand-in for instagrapi.Client that never touches the network.
+
+    Every call sleeps for a lognormally distributed latency and fails with
+    ClientError (or PleaseWaitFewMinutes) at the configured rates. The data
+    is derived from the username or pk, so repeated lookups return the same
+    profile and posts the way the real API would.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.settings = {}
+        self.user_id = None
+
+    def _simulate(self, method):
+        median = _env_float('BENCH_LATENCY_MS', method, BENCH_LATENCY_MS) / 1000.0
+        sigma = _env_float('BENCH_LATENCY_SIGMA', method, BENCH_LATENCY_SIGMA)
+        if median > 0:
+            time.sleep(median * math.exp(random.gauss(0, sigma)) if sigma > 0 else median)
+        roll = random.random()
+        if roll < _env_float('BENCH_THROTTLE_RATE', method, BENCH_THROTTLE_RATE):
+            raise PleaseWaitFewMinutes(f"Simulated throttling in {method}")
+        if roll < _env_float('BENCH_ERROR_RATE', method, BENCH_ERROR_RATE):
+            raise ClientError(f"Simulated upstream failure in {method}")
+
+    # Session handling, as used by the session pool
+    def set_settings(self, settings):
+        self.settings = settings
+        self.user_id = (settings.get('authorization_data') or {}).get('ds_user_id')
+        return True
+
+    def get_settings(self):
+        return self.settings
+
+    def account_info(self):
+        self._simulate('account_info')
+        return Account(
+            pk=str(self.user_id), username='bench', full_name='Bench', is_private=False,
+            profile_pic_url=f"{BENCH_IMAGE_URL}/pic/bench.jpg", is_verified=False, is_business=False,
+        )
+
+    # Profiles
+    def _user(self, user_pk):
+        rng = _rng('user', user_pk)
+        username = username_for(user_pk)
+        followers = int(10 ** rng.uniform(2, 7))
+        return User(
+            pk=str(user_pk),
+            username=username,
+            full_name=username.title(),
+            is_private=False,
+            profile_pic_url=f"{BENCH_IMAGE_URL}/pic/{username}.jpg",
+            is_verified=followers > 10 ** 6,
+            media_count=rng.randint(10, 2000),
+            follower_count=followers,
+            following_count=rng.randint(50, 3000),
+            biography=f"Benchmark account {username}",
+            is_business=rng.random() < 0.3,
+            public_email=f"{username}@example.com" if rng.random() < 0.2 else None,
+            category_name='Creator',
+        )
+
+    def user_info_by_username(self, username):
+        self._simulate('user_info_by_username')
+        if username.startswith('missing'):
+            raise UserNotFound(f"{username} not found")
+        return self._user(user_pk_for(username))
+
+    def user_info(self, user_pk):
+        self._simulate('user_info')
+        return self._user(int(user_pk))
+
+    # Posts
+    def _media(self, media_pk):
+        media_pk = int(media_pk)
+        user_pk, index = divmod(media_pk, MEDIA_PK_STRIDE)
+        owner = self._user(user_pk)
+        rng = _rng('media', media_pk)
+        likes = int(owner.follower_count * rng.uniform(0.005, 0.08))
+        return Media(
+            pk=str(media_pk),
+            id=f"{media_pk}_{user_pk}",
+            code=shortcode_from_pk(media_pk),
+            taken_at=EPOCH - timedelta(days=index * rng.uniform(0.5, 3.0)),
+            media_type=rng.choice((1, 1, 2, 8)),
+            location=Location(name='Benchmark City') if rng.random() < 0.3 else None,
+            user=UserShort(pk=owner.pk, username=owner.username, full_name=owner.full_name,
+                           profile_pic_url=owner.profile_pic_url),
+            comment_count=int(likes * rng.uniform(0.01, 0.05)),
+            like_count=likes,
+            caption_text=f"Post {index} by {owner.username}",
+            usertags=[],
+            sponsor_tags=[],
+        )
+
+    def user_medias(self, user_pk, amount=20, sleep=None):
+        self._simulate('user_medias')
+        base = int(user_pk) * MEDIA_PK_STRIDE
+        return [self._media(base + index) for index in range(amount or 20)]
+
+    def media_info(self, media_pk, use_cache=True):
+        self._simulate('media_info')
+        return self._media(media_pk)
+
+    # Interactions
+    def media_likers(self, media_pk):
+        self._simulate('media_likers')
+        count = min(BENCH_LIKERS, self._media(media_pk).like_count)
+        return [UserShort(pk=str(900000 + index), username=f"liker{index:05d}") for index in range(count)]
+
+    def _comment(self, media_pk, index):
+        return Comment(
+            pk=f"{media_pk}{index:05d}",
+            text=f"Comment {index}",
+            user=UserShort(pk=str(800000 + index), username=f"commenter{index:05d}"),
+            created_at_utc=EPOCH + timedelta(minutes=index),
+            content_type='comment',
+            status='Active',
+        )
+
+    def media_comments(self, media_pk, amount=20):
+        self._simulate('media_comments')
+        count = min(amount or BENCH_COMMENTS, BENCH_COMMENTS)
+        return [self._comment(media_pk, index) for index in range(count)]
+
+    def media_comments_chunk(self, media_pk, max_amount, min_id=None):
+        self._simulate('media_comments_chunk')
+        start = int(min_id or 0)
+        end = min(start + max_amount, BENCH_COMMENTS)
+        comments = [self._comment(media_pk, index) for index in range(start, end)]
+        return comments, (str(end) if end < BENCH_COMMENTS else None)
+
+    # Direct messages
+    def direct_send(self, text, user_ids=None, thread_ids=None):
+        self._simulate('direct_send')
+        return {'thread_id': f"bench-{user_ids[0] if user_ids else 0}", 'text': text}
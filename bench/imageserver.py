@@ -0,0 +1,61 @@
+import os
+import time
+import random
+import hashlib
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Size and latency of the served profile pictures
+BENCH_IMAGE_BYTES = int(os.getenv('BENCH_IMAGE_BYTES', str(40 * 1024)))
+BENCH_IMAGE_LATENCY_MS = float(os.getenv('BENCH_IMAGE_LATENCY_MS', '30'))
+
+# Just enough of a JPEG header for anything sniffing the content type
+JPEG_HEADER = b'\xff\xd8\xff\xe0\x00\x10JFIF\x00'
+
+
+def image_bytes(name, size=BENCH_IMAGE_BYTES):
+    """Deterministic pseudo-image for a path, so the same URL always hashes the same."""
+    seed = hashlib.sha256(name.encode()).digest()
+    body = random.Random(seed).getrandbits(8 * size).to_bytes(size, 'little')
+    return JPEG_HEADER + body[len(JPEG_HEADER):]
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    latency_ms = BENCH_IMAGE_LATENCY_MS
+
+    def do_GET(self):
+        if not self.path.startswith('/pic/'):
+            self.send_error(404)
+            return
+        if self.latency_ms > 0:
+            time.sleep(self.latency_ms / 1000.0)
+        body = image_bytes(self.path)
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def start_image_server(host='127.0.0.1', port=8765, latency_ms=BENCH_IMAGE_LATENCY_MS):
+    """Serves /pic/<name> from a daemon thread and returns the server."""
+    handler = type('ImageHandler', (ImageHandler,), {'latency_ms': latency_ms})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='bench-images', daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    port = int(os.getenv('BENCH_IMAGE_PORT', '8765'))
+    logger.info(f"Serving fake profile pictures on port {port}")
+    ThreadingHTTPServer(('127.0.0.1', port), ImageHandler).serve_forever()
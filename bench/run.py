@@ -0,0 +1,269 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+from bench.imageserver import start_image_server
+from bench.scenarios import SCENARIOS
+from ratelimit import DEFAULT_BUDGETS
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test of app.py against a fake Instagram client.")
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help="Scenario to run (repeatable, default: all)")
+    parser.add_argument('--requests', type=int, default=200, help="Measured requests per scenario")
+    parser.add_argument('--warmup', type=int, default=20, help="Unmeasured requests per scenario before measuring")
+    parser.add_argument('--concurrency', type=int, default=8, help="Concurrent clients")
+    parser.add_argument('--workers', type=int, default=2, help="gunicorn worker processes")
+    parser.add_argument('--threads', type=int, default=8, help="Threads per gunicorn worker")
+    parser.add_argument('--asgi', action='store_true', help="Serve asgi.py with uvicorn instead of app.py with gunicorn")
+    parser.add_argument('--port', type=int, default=8700)
+    parser.add_argument('--image-port', type=int, default=8765)
+    parser.add_argument('--users', type=int, default=500, help="Distinct fake accounts to spread lookups over")
+    parser.add_argument('--sessions', type=int, default=4, help="Fake Instagram sessions in the pool")
+    parser.add_argument('--latency-ms', type=float, default=150.0, help="Median fake upstream latency")
+    parser.add_argument('--latency-sigma', type=float, default=0.5, help="Lognormal spread of upstream latency")
+    parser.add_argument('--error-rate', type=float, default=0.01, help="Fraction of upstream calls that fail")
+    parser.add_argument('--image-latency-ms', type=float, default=30.0)
+    parser.add_argument('--nocache', action='store_true', help="Send ?nocache=1 so every request goes upstream")
+    parser.add_argument('--keep-rate-limits', action='store_true', help="Keep the production rate budgets instead of lifting them")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', dest='json_path', help="Write the results to this file")
+    parser.add_argument('--baseline', help="Results file from an earlier run to compare against")
+    parser.add_argument('--max-regression', type=float, default=0.2, help="Allowed relative p95/p99/throughput regression")
+    return parser.parse_args(argv)
+
+
+def server_env(args, workdir):
+    env = dict(os.environ)
+    sessions = [
+        {'authorization_data': {'ds_user_id': str(index + 1), 'sessionid': f"{index + 1}%3Abench"}, 'cookies': {}}
+        for index in range(args.sessions)
+    ]
+    env.update({
+        'NEON_DB_URL': f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        'INSTAGRAM_SESSION_JSON': '',
+        'INSTAGRAM_SESSION_FILES': '',
+        'INSTAGRAM_SESSION_JSONS': json.dumps(sessions),
+        'CACHE_DIR': os.path.join(workdir, 'upstream'),
+        'IMAGE_CACHE_DIR': os.path.join(workdir, 'images'),
+        'JOB_DB_PATH': os.path.join(workdir, 'jobs.sqlite3'),
+        'PROFILE_DIR': os.path.join(workdir, 'profiles'),
+        'SCHEDULER_ENABLED': '0',
+        'BENCH_IMAGE_URL': f"http://127.0.0.1:{args.image_port}",
+        'BENCH_LATENCY_MS': str(args.latency_ms),
+        'BENCH_LATENCY_SIGMA': str(args.latency_sigma),
+        'BENCH_ERROR_RATE': str(args.error_rate),
+        # Keeps /profile payloads comparable with earlier runs; never enable this in production
+        'OTP_ECHO': '1',
+    })
+    if not args.keep_rate_limits:
+        # The production budgets would make every scenario measure the pacing, not the app
+        env.update({f"RATE_LIMIT_{name.upper()}": '10000/10000' for name in DEFAULT_BUDGETS})
+    return env
+
+
+def start_server(args, workdir):
+    log = open(os.path.join(workdir, 'server.log'), 'w')
+    if args.asgi:
+        command = [
+            sys.executable, '-m', 'uvicorn',
+            '--workers', str(args.workers),
+            '--host', '127.0.0.1',
+            '--port', str(args.port),
+            '--no-access-log',
+            'bench.asgi:app',
+        ]
+    else:
+        command = [
+            sys.executable, '-m', 'gunicorn',
+            '--workers', str(args.workers),
+            '--threads', str(args.threads),
+            '--bind', f"127.0.0.1:{args.port}",
+            '--timeout', '120',
+            'bench.wsgi:app',
+        ]
+    env = server_env(args, workdir)
+    subprocess.run([sys.executable, 'migrate.py'], cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT, check=True)
+    process = subprocess.Popen(command, cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    base_url = f"http://127.0.0.1:{args.port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{command[2]} exited with {process.returncode}, see {log.name}")
+        try:
+            if requests.get(f"{base_url}/ready", timeout=5).status_code == 200:
+                return process, base_url
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"{command[2]} did not become ready, see {log.name}")
+
+
+def _children(pid):
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name may contain spaces, so parse from the closing parenthesis
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            children.append(int(entry))
+    return children
+
+
+def tree_rss_bytes(pid):
+    """Resident memory of a process and its direct children (the gunicorn workers), Linux only."""
+    total = 0
+    for member in [pid] + _children(pid):
+        try:
+            with open(f"/proc/{member}/status") as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            continue
+    return total
+
+
+class MemorySampler:
+    """Tracks the peak RSS of the server while a scenario runs."""
+
+    def __init__(self, pid, interval=0.25):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while True:
+            self.peak = max(self.peak, tree_rss_bytes(self.pid))
+            if self._stop.wait(self.interval):
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_scenario(name, base_url, args, server_pid):
+    build = SCENARIOS[name]
+    rng = random.Random(f"{args.seed}:{name}")
+    plan = [build(rng, args.users) for _ in range(args.warmup + args.requests)]
+    if args.nocache:
+        plan = [(method, path + ('&' if '?' in path else '?') + 'nocache=1', body) for method, path, body in plan]
+
+    local = threading.local()
+
+    def send(request):
+        method, path, body = request
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            status = session.request(method, base_url + path, json=body, timeout=120).status_code
+        except requests.RequestException:
+            status = 0
+        return time.perf_counter() - start, status
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(send, plan[:args.warmup]))
+        with MemorySampler(server_pid) as memory:
+            started = time.perf_counter()
+            results = list(executor.map(send, plan[args.warmup:]))
+            elapsed = time.perf_counter() - started
+
+    latencies = np.array([latency for latency, _ in results]) * 1000
+    statuses = [status for _, status in results]
+    p50, p95, p99 = np.percentile(latencies, (50, 95, 99)) if latencies.size else (0, 0, 0)
+    return {
+        'requests': len(results),
+        'errors': sum(1 for status in statuses if status == 0 or status >= 500),
+        'client_errors': sum(1 for status in statuses if 400 <= status < 500),
+        'mean_ms': round(float(latencies.mean()), 2) if latencies.size else 0,
+        'p50_ms': round(float(p50), 2),
+        'p95_ms': round(float(p95), 2),
+        'p99_ms': round(float(p99), 2),
+        'throughput_rps': round(len(results) / elapsed, 2) if elapsed else 0,
+        'peak_rss_mb': round(memory.peak / 2 ** 20, 1),
+    }
+
+
+def compare(results, baseline, max_regression):
+    """Human readable regressions of results against a baseline run."""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        for metric in ('p95_ms', 'p99_ms'):
+            if previous[metric] and current[metric] > previous[metric] * (1 + max_regression):
+                regressions.append(f"{name}: {metric} {previous[metric]} -> {current[metric]}")
+        if previous['throughput_rps'] and current['throughput_rps'] < previous['throughput_rps'] * (1 - max_regression):
+            regressions.append(f"{name}: throughput_rps {previous['throughput_rps']} -> {current['throughput_rps']}")
+    return regressions
+
+
+def print_table(results):
+    columns = ('requests', 'errors', 'p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps', 'peak_rss_mb')
+    print(f"{'scenario':<22}" + ''.join(f"{column:>16}" for column in columns))
+    for name, row in results.items():
+        print(f"{name:<22}" + ''.join(f"{row[column]:>16}" for column in columns))
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    scenarios = args.scenario or list(SCENARIOS)
+
+    with tempfile.TemporaryDirectory(prefix='bench-') as workdir:
+        images = start_image_server(port=args.image_port, latency_ms=args.image_latency_ms)
+        process, base_url = start_server(args, workdir)
+        try:
+            results = {}
+            for name in scenarios:
+                results[name] = run_scenario(name, base_url, args, process.pid)
+                print(f"{name}: p95 {results[name]['p95_ms']} ms, {results[name]['throughput_rps']} req/s", file=sys.stderr)
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+            images.shutdown()
+
+    print_table(results)
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({'config': vars(args), 'scenarios': results}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f)['scenarios'], args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
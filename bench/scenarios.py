@@ -0,0 +1,42 @@
+from urllib.parse import urlencode
+
+from bench.fakeclient import MEDIA_PK_STRIDE, shortcode_from_pk, username_for
+
+# Posts per user that scenarios link to; kept small so media lookups repeat like real traffic
+POSTS_PER_USER = 12
+BATCH_SIZE = 10
+
+
+def pick_user(rng, users):
+    """Skewed pick over users 1..users: a few hot accounts and a long tail, like real lookups."""
+    return username_for(1 + (int(rng.paretovariate(1.2)) - 1) % users)
+
+
+def pick_post_url(rng, users):
+    user_pk = 1 + (int(rng.paretovariate(1.2)) - 1) % users
+    media_pk = user_pk * MEDIA_PK_STRIDE + rng.randrange(POSTS_PER_USER)
+    return f"https://www.instagram.com/p/{shortcode_from_pk(media_pk)}/"
+
+
+def _get(path, **params):
+    return 'GET', f"{path}?{urlencode(params)}", None
+
+
+# Each scenario maps (rng, users) to one (method, path with query, JSON body) request
+SCENARIOS = {
+    'profile': lambda rng, users: _get('/profile', username=pick_user(rng, users)),
+    'profile_search': lambda rng, users: _get('/profileSearch', username=pick_user(rng, users)),
+    'profile_stats': lambda rng, users: _get('/profile/stats', username=pick_user(rng, users), window=30),
+    'profile_history': lambda rng, users: _get('/profile/history', username=pick_user(rng, users)),
+    'profiles_batch': lambda rng, users: (
+        'POST', '/profiles/batch', {'usernames': [pick_user(rng, users) for _ in range(BATCH_SIZE)]}
+    ),
+    'post_interactions': lambda rng, users: _get(
+        '/profile/post_interactions', username=pick_user(rng, users), limit=50
+    ),
+    'post_details': lambda rng, users: _get('/post/details_by_url', post_url=pick_post_url(rng, users)),
+    'post_details_by_url': lambda rng, users: _get('/postDetails_by_url', post_url=pick_post_url(rng, users)),
+    'fetch_post_stats': lambda rng, users: (
+        'POST', '/fetch_post_stats', {'urls': [pick_post_url(rng, users) for _ in range(BATCH_SIZE)]}
+    ),
+}
@@ -0,0 +1,10 @@
+import sessionpool
+from bench.fakeclient import FakeClient
+
+# gunicorn entry point (bench.wsgi:app) serving app.py against the fake Instagram client.
+# The session pool builds its clients from sessionpool.Client, so swapping it before
+# app.py is imported keeps every other layer (pool, rate budgets, caches, write-behind,
+# jobs) exactly as it runs in production.
+sessionpool.Client = FakeClient
+
+from app import app  # noqa: E402
@@ -0,0 +1,289 @@
+import os
+import time
+import pickle
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+import metrics
+import singleflight
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Cache configuration, overridable from the environment
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '2048'))
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory')  # memory, redis or filesystem
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+CACHE_DIR = os.getenv('CACHE_DIR', '.cache/upstream')
+# The filesystem backend is swept of expired files this often, and trimmed to this many entries
+CACHE_FILE_MAX_ENTRIES = int(os.getenv('CACHE_FILE_MAX_ENTRIES', '50000'))
+CACHE_FILE_SWEEP_INTERVAL = float(os.getenv('CACHE_FILE_SWEEP_INTERVAL', '60'))
+
+# Time-to-live in seconds for each kind of upstream entity
+CACHE_TTLS = {
+    'profile': int(os.getenv('CACHE_TTL_PROFILE', '300')),
+    'medias': int(os.getenv('CACHE_TTL_MEDIAS', '300')),
+    'media': int(os.getenv('CACHE_TTL_MEDIA', '120')),
+    'likers': int(os.getenv('CACHE_TTL_LIKERS', '60')),
+    'comments': int(os.getenv('CACHE_TTL_COMMENTS', '60')),
+    'stats': int(os.getenv('CACHE_TTL_STATS', '300')),
+}
+DEFAULT_TTL = int(os.getenv('CACHE_TTL_DEFAULT', '60'))
+
+
+class LRUCache:
+    """Bounded in-process cache with per-entry expiry, safe to share between threads."""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisBackend:
+    """Shared cache for multi-worker deployments, backed by Redis."""
+
+    def __init__(self, url):
+        import redis  # Optional dependency, only needed for CACHE_BACKEND=redis
+        self._redis = redis.Redis.from_url(url)
+
+    def get(self, key):
+        raw = self._redis.get(key)
+        return pickle.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl):
+        self._redis.set(key, pickle.dumps(value), ex=max(1, int(ttl)))
+
+    def delete(self, key):
+        self._redis.delete(key)
+
+
+class FileBackend:
+    """Shared cache for multi-worker deployments on one host, stored as pickles on disk.
+
+    Each file's mtime is set to its expiry time, so the periodic sweep can drop
+    expired entries, and trim the soonest-expiring ones past max_entries,
+    from a directory scan without unpickling anything.
+    """
+
+    def __init__(self, directory, max_entries=CACHE_FILE_MAX_ENTRIES, sweep_interval=CACHE_FILE_SWEEP_INTERVAL):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.sweep_interval = sweep_interval
+        self._sweep_lock = threading.Lock()
+        self._last_sweep = 0.0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                expires_at, value = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Discarding unreadable cache file for {key}: {str(e)}")
+            self.delete(key)
+            return None
+        if expires_at < time.time():
+            self.delete(key)
+            return None
+        return value
+
+    def set(self, key, value, ttl):
+        # Write to a temp file first so concurrent readers never see a partial pickle
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        expires_at = time.time() + ttl
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((expires_at, value), f)
+        os.utime(tmp_path, (expires_at, expires_at))
+        os.replace(tmp_path, path)
+        if time.monotonic() - self._last_sweep > self.sweep_interval:
+            self.sweep()
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def sweep(self):
+        """Removes expired and orphaned temp files, then trims the cache to 90% of max_entries."""
+        if not self._sweep_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_sweep = time.monotonic()
+            now = time.time()
+            live = []
+            for entry in os.scandir(self.directory):
+                try:
+                    mtime = entry.stat().st_mtime
+                    if entry.name.endswith('.tmp'):
+                        # A writer that died between dump and rename; live temp files are seconds old
+                        if mtime < now - 3600:
+                            os.remove(entry.path)
+                    elif mtime < now:
+                        os.remove(entry.path)
+                    else:
+                        live.append((mtime, entry.path))
+                except FileNotFoundError:
+                    # Removed or replaced by another worker meanwhile
+                    continue
+            if len(live) > self.max_entries:
+                live.sort()
+                for _, path in live[:len(live) - int(self.max_entries * 0.9)]:
+                    try:
+                        os.remove(path)
+                        self.evictions += 1
+                    except FileNotFoundError:
+                        pass
+        except OSError as e:
+            logger.warning(f"Cache sweep of {self.directory} failed: {str(e)}")
+        finally:
+            self._sweep_lock.release()
+
+
+def _create_shared_backend():
+    try:
+        if CACHE_BACKEND == 'redis':
+            return RedisBackend(CACHE_REDIS_URL)
+        if CACHE_BACKEND == 'filesystem':
+            return FileBackend(CACHE_DIR)
+    except Exception as e:
+        logger.error(f"Could not initialise {CACHE_BACKEND} cache backend, using in-process cache only: {str(e)}")
+    return None
+
+
+local = LRUCache()
+shared = _create_shared_backend()
+
+_counters = {'hits': 0, 'misses': 0, 'shared_hits': 0, 'bypasses': 0}
+_counters_lock = threading.Lock()
+
+
+# Per-namespace results exported to /metrics; shared hits are already counted as hits
+_LOOKUP_RESULTS = {'hits': 'hit', 'misses': 'miss', 'bypasses': 'bypass'}
+
+
+def _count(name, namespace):
+    with _counters_lock:
+        _counters[name] += 1
+    if name in _LOOKUP_RESULTS:
+        metrics.cache_lookups.inc(namespace=namespace, result=_LOOKUP_RESULTS[name])
+
+
+def get_or_load(namespace, key, loader, bypass=False):
+    """Returns the cached value for (namespace, key), calling loader() on a miss.
+
+    With bypass=True the cache is not read, but the fresh value still replaces
+    whatever was stored so later callers benefit from the refresh. Callers
+    that miss while the same key is already being loaded wait for that load
+    instead of issuing their own.
+    """
+    cache_key = f"{namespace}:{key}"
+    ttl = CACHE_TTLS.get(namespace, DEFAULT_TTL)
+
+    if bypass:
+        _count('bypasses', namespace)
+    else:
+        entry = local.get(cache_key)
+        if entry is not None:
+            _count('hits', namespace)
+            return entry[1]
+        if shared is not None:
+            try:
+                value = shared.get(cache_key)
+            except Exception as e:
+                logger.warning(f"Shared cache read failed for {cache_key}: {str(e)}")
+                value = None
+            if value is not None:
+                _count('hits', namespace)
+                _count('shared_hits', namespace)
+                local.set(cache_key, value, ttl)
+                return value
+        _count('misses', namespace)
+
+    def load_and_store():
+        value = loader()
+        local.set(cache_key, value, ttl)
+        if shared is not None:
+            try:
+                shared.set(cache_key, value, ttl)
+            except Exception as e:
+                logger.warning(f"Shared cache write failed for {cache_key}: {str(e)}")
+        return value
+
+    # Concurrent misses for the same key share one upstream call
+    return singleflight.upstream.do(cache_key, load_and_store)
+
+
+def peek(namespace, key):
+    """Returns the cached value for (namespace, key) or None, never calling upstream."""
+    cache_key = f"{namespace}:{key}"
+    entry = local.get(cache_key)
+    if entry is not None:
+        _count('hits', namespace)
+        return entry[1]
+    if shared is not None:
+        try:
+            value = shared.get(cache_key)
+        except Exception as e:
+            logger.warning(f"Shared cache read failed for {cache_key}: {str(e)}")
+            return None
+        if value is not None:
+            _count('hits', namespace)
+            _count('shared_hits', namespace)
+            local.set(cache_key, value, CACHE_TTLS.get(namespace, DEFAULT_TTL))
+            return value
+    return None
+
+
+def stats():
+    with _counters_lock:
+        data = dict(_counters)
+    lookups = data['hits'] + data['misses']
+    data['evictions'] = local.evictions + getattr(shared, 'evictions', 0)
+    data['entries'] = len(local)
+    data['hit_ratio'] = round(data['hits'] / lookups, 4) if lookups else 0.0
+    data['backend'] = CACHE_BACKEND if shared is not None else 'memory'
+    data['singleflight'] = singleflight.upstream.stats()
+    return data
@@ -0,0 +1,120 @@
+import os
+import logging
+
+import numpy as np
+from dotenv import load_dotenv
+
+import cache
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Window limits for /profile/stats, in number of most recent posts
+STATS_DEFAULT_WINDOW = int(os.getenv('STATS_DEFAULT_WINDOW', '10'))
+STATS_MAX_WINDOW = int(os.getenv('STATS_MAX_WINDOW', '200'))
+# Modified z-score above which a post counts as an outlier (Iglewicz & Hoaglin)
+OUTLIER_THRESHOLD = float(os.getenv('STATS_OUTLIER_THRESHOLD', '3.5'))
+
+MEDIA_TYPE_NAMES = {1: 'Image', 2: 'Video', 8: 'Album'}
+PERCENTILES = (25, 50, 75, 90)
+
+
+def _round(value, digits=2):
+    value = float(value)
+    return round(value, digits) if np.isfinite(value) else None
+
+
+def _distribution(values):
+    if not values.size:
+        return {'mean': 0, 'median': 0, 'min': 0, 'max': 0, **{f"p{p}": 0 for p in PERCENTILES}}
+    points = np.percentile(values, PERCENTILES)
+    return {
+        'mean': _round(values.mean()),
+        'median': _round(np.median(values)),
+        'min': _round(values.min()),
+        'max': _round(values.max()),
+        **{f"p{p}": _round(point) for p, point in zip(PERCENTILES, points)},
+    }
+
+
+def media_columns(medias):
+    """Columnar arrays (likes, comments, media_type, taken_at epoch seconds) for a list of Media."""
+    count = len(medias)
+    likes = np.fromiter((m.like_count or 0 for m in medias), dtype=np.int64, count=count)
+    comments = np.fromiter((m.comment_count or 0 for m in medias), dtype=np.int64, count=count)
+    media_types = np.fromiter((m.media_type or 0 for m in medias), dtype=np.int8, count=count)
+    taken_at = np.fromiter(
+        (m.taken_at.timestamp() if m.taken_at else np.nan for m in medias), dtype=np.float64, count=count
+    )
+    codes = [m.code for m in medias]
+    return likes, comments, media_types, taken_at, codes
+
+
+def compute_stats(followers, medias):
+    """Engagement analytics over a window of posts, vectorized over columnar arrays."""
+    likes, comments, media_types, taken_at, codes = media_columns(medias)
+    interactions = likes + comments
+    followers = max(int(followers or 0), 0)
+    # Per-post engagement rate in percent of followers
+    rates = interactions / followers * 100 if followers else np.zeros(interactions.shape, dtype=np.float64)
+
+    by_type = {}
+    for type_id in np.unique(media_types):
+        mask = media_types == type_id
+        by_type[MEDIA_TYPE_NAMES.get(int(type_id), str(int(type_id)))] = {
+            'posts': int(mask.sum()),
+            'average_likes': _round(likes[mask].mean()),
+            'average_comments': _round(comments[mask].mean()),
+            'engagement_rate': _round(rates[mask].mean()),
+        }
+
+    # Posting cadence from the gaps between consecutive posts
+    times = np.sort(taken_at[np.isfinite(taken_at)])
+    gaps_days = np.diff(times) / 86400.0
+    span_days = (times[-1] - times[0]) / 86400.0 if times.size > 1 else 0.0
+    cadence = {
+        'average_gap_days': _round(gaps_days.mean()) if gaps_days.size else None,
+        'median_gap_days': _round(np.median(gaps_days)) if gaps_days.size else None,
+        'posts_per_week': _round(times.size / span_days * 7) if span_days > 0 else None,
+    }
+
+    # Robust outliers: modified z-score over interactions using the median absolute deviation
+    outliers = []
+    if interactions.size > 2:
+        median = np.median(interactions)
+        mad = np.median(np.abs(interactions - median))
+        if mad > 0:
+            scores = 0.6745 * (interactions - median) / mad
+            for index in np.flatnonzero(np.abs(scores) > OUTLIER_THRESHOLD):
+                outliers.append({
+                    'code': codes[index],
+                    'post_url': f"https://www.instagram.com/p/{codes[index]}/",
+                    'likes': int(likes[index]),
+                    'comments': int(comments[index]),
+                    'score': _round(scores[index]),
+                })
+
+    total_likes = int(likes.sum())
+    return {
+        'posts_analyzed': int(likes.size),
+        'likes': _distribution(likes),
+        'comments': _distribution(comments),
+        'engagement_rate': _distribution(rates),
+        'comment_like_ratio': _round(comments.sum() / total_likes, 4) if total_likes else None,
+        'by_media_type': by_type,
+        'cadence': cadence,
+        'outliers': outliers,
+    }
+
+
+def profile_stats(profile, window, load_medias, bypass=False):
+    """Cached analytics for (user, window). load_medias(window) returns the most recent posts."""
+    return cache.get_or_load(
+        'stats',
+        f"{profile.pk}:{window}",
+        lambda: compute_stats(profile.follower_count, load_medias(window)),
+        bypass=bypass,
+    )
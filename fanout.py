@@ -0,0 +1,71 @@
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from dotenv import load_dotenv
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Fan-out limits, overridable from the environment
+FANOUT_MAX_WORKERS = int(os.getenv('FANOUT_MAX_WORKERS', '8'))
+FANOUT_ITEM_TIMEOUT = float(os.getenv('FANOUT_ITEM_TIMEOUT', '30'))
+
+# How often the collector wakes up to check for items that ran past their timeout
+POLL_INTERVAL = 0.25
+
+
+class ItemTimeout(Exception):
+    """Raised in place of a result when a single item runs past its timeout."""
+
+
+def fan_out(func, items, max_workers=None, timeout=None):
+    """Runs func over items on a bounded thread pool.
+
+    Yields (index, item, result, error) tuples in completion order, so one
+    failing or slow item never takes the rest of the batch down with it.
+    The timeout applies to each item from the moment it starts running.
+    """
+    items = list(items)
+    if not items:
+        return
+
+    max_workers = max(1, min(max_workers or FANOUT_MAX_WORKERS, len(items)))
+    timeout = timeout if timeout is not None else FANOUT_ITEM_TIMEOUT
+    started = {}
+
+    def run(index):
+        started[index] = time.monotonic()
+        return func(items[index])
+
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fanout')
+    pending = {}
+    try:
+        pending = {executor.submit(run, index): index for index in range(len(items))}
+        while pending:
+            done, _ = wait(pending, timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                try:
+                    yield index, items[index], future.result(), None
+                except Exception as e:
+                    yield index, items[index], None, e
+
+            # Give up on items that have been running too long; the worker thread
+            # finishes in the background but its result is discarded.
+            now = time.monotonic()
+            for future, index in list(pending.items()):
+                start = started.get(index)
+                if start is not None and timeout and now - start > timeout:
+                    pending.pop(future)
+                    logger.warning(f"Fan-out item {index} timed out after {timeout}s")
+                    yield index, items[index], None, ItemTimeout(f"Timed out after {timeout}s")
+    finally:
+        # Don't block the response on stragglers or queued work the caller abandoned
+        for future in list(pending):
+            future.cancel()
+        executor.shutdown(wait=False)
@@ -0,0 +1,18 @@
+import gc
+import os
+
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Import app.py once in the master and fork the workers from it, so the heavy imports
+# (instagrapi, pydantic models, SQLAlchemy, NumPy) are shared copy-on-write and a worker
+# boot or reload costs a fork. Database connections and Instagram sessions are opened
+# lazily inside each worker, never in the master.
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') == '1'
+
+
+def pre_fork(server, worker):
+    # Keep the collector from touching, and so un-sharing, everything imported by the master
+    gc.freeze()
@@ -0,0 +1,239 @@
+import os
+import asyncio
+import base64
+import hashlib
+import logging
+import threading
+from urllib.parse import urlparse
+
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+import metrics
+from ratelimit import governor, RateBudgetExceeded
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Image cache configuration, overridable from the environment
+IMAGE_CACHE_DIR = os.getenv('IMAGE_CACHE_DIR', '.cache/images')
+IMAGE_CACHE_MAX_BYTES = int(os.getenv('IMAGE_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+IMAGE_FETCH_TIMEOUT = (
+    float(os.getenv('IMAGE_CONNECT_TIMEOUT', '3.05')),
+    float(os.getenv('IMAGE_READ_TIMEOUT', '10')),
+)
+IMAGE_POOL_SIZE = int(os.getenv('IMAGE_POOL_SIZE', '20'))
+
+# base64 inlines the picture in the JSON body, url returns a /media/pic/<hash> link
+PROFILE_PIC_MODE = os.getenv('PROFILE_PIC_MODE', 'base64')
+
+CHUNK_SIZE = 64 * 1024
+
+# A picture that fails with one of these (CDN error status, expired signed URL, timeout,
+# refused connection, spent CDN budget, unreadable blob) is left out rather than failing the lookup
+PIC_FETCH_ERRORS = (requests.RequestException, OSError, RateBudgetExceeded)
+
+BLOB_DIR = os.path.join(IMAGE_CACHE_DIR, 'blobs')
+INDEX_DIR = os.path.join(IMAGE_CACHE_DIR, 'index')
+os.makedirs(BLOB_DIR, exist_ok=True)
+os.makedirs(INDEX_DIR, exist_ok=True)
+
+# One keep-alive connection pool shared by every request thread
+http = requests.Session()
+_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=IMAGE_POOL_SIZE, max_retries=1)
+http.mount('https://', _adapter)
+http.mount('http://', _adapter)
+
+_size_lock = threading.Lock()
+_cache_bytes = None
+
+
+def _url_key(url):
+    # CDN links carry expiring signatures in the query string; the path identifies the image
+    parsed = urlparse(str(url))
+    return hashlib.sha256(f"{parsed.netloc}{parsed.path}".encode('utf-8')).hexdigest()
+
+
+def blob_path(content_hash):
+    return os.path.join(BLOB_DIR, content_hash)
+
+
+def is_valid_hash(content_hash):
+    return len(content_hash) == 64 and all(c in '0123456789abcdef' for c in content_hash)
+
+
+def _scan_cache_bytes():
+    total = 0
+    for entry in os.scandir(BLOB_DIR):
+        if entry.is_file() and not entry.name.endswith('.tmp'):
+            total += entry.stat().st_size
+    return total
+
+
+def _track_size(delta):
+    global _cache_bytes
+    with _size_lock:
+        if _cache_bytes is None:
+            _cache_bytes = _scan_cache_bytes()
+        else:
+            _cache_bytes += delta
+        over = _cache_bytes > IMAGE_CACHE_MAX_BYTES
+    if over:
+        _evict()
+
+
+def _evict():
+    """Drops least recently used blobs until the cache is back under 90% of its limit."""
+    global _cache_bytes
+    with _size_lock:
+        blobs = [e for e in os.scandir(BLOB_DIR) if e.is_file() and not e.name.endswith('.tmp')]
+        blobs.sort(key=lambda e: e.stat().st_mtime)
+        total = sum(e.stat().st_size for e in blobs)
+        target = IMAGE_CACHE_MAX_BYTES * 0.9
+        for entry in blobs:
+            if total <= target:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                total -= size
+            except FileNotFoundError:
+                pass
+        _cache_bytes = total
+    # Index entries pointing at evicted blobs are treated as misses on lookup
+
+
+def _lookup(url_key):
+    try:
+        with open(os.path.join(INDEX_DIR, url_key), 'r') as f:
+            content_hash = f.read().strip()
+    except FileNotFoundError:
+        return None
+    path = blob_path(content_hash)
+    if not os.path.exists(path):
+        return None
+    # Touch the blob so eviction sees it as recently used
+    os.utime(path, None)
+    return content_hash
+
+
+def _tmp_path(directory, url_key):
+    # Unique per writer, so concurrent downloads of one URL (threads or coroutines) never share a file
+    return os.path.join(directory, f"{url_key}.{os.getpid()}.{os.urandom(6).hex()}.tmp")
+
+
+def _store(tmp_path, digest, size, url_key):
+    """Moves a downloaded temp file into the blob store and indexes it. Returns the content hash."""
+    content_hash = digest.hexdigest()
+    path = blob_path(content_hash)
+    if os.path.exists(path):
+        os.remove(tmp_path)
+        size = 0
+    else:
+        os.replace(tmp_path, path)
+
+    index_tmp = _tmp_path(INDEX_DIR, url_key)
+    with open(index_tmp, 'w') as f:
+        f.write(content_hash)
+    os.replace(index_tmp, os.path.join(INDEX_DIR, url_key))
+    if size:
+        _track_size(size)
+    return content_hash
+
+
+def _download(url, url_key):
+    tmp_path = _tmp_path(BLOB_DIR, url_key)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with governor.http_get(str(url), session=http, stream=True, timeout=IMAGE_FETCH_TIMEOUT) as response:
+            response.raise_for_status()
+            with open(tmp_path, 'wb') as f:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+        return _store(tmp_path, digest, size, url_key)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+async def _download_async(url, url_key, client):
+    bucket = governor.bucket('cdn')
+    delay = bucket.reserve()
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+    tmp_path = _tmp_path(BLOB_DIR, url_key)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with metrics.upstream_call('cdn_get'):
+            async with client.stream('GET', str(url)) as response:
+                if response.status_code == 429:
+                    bucket.penalize()
+                else:
+                    bucket.relax()
+                response.raise_for_status()
+                # The files are small and local, so writing them inline doesn't stall the loop
+                with open(tmp_path, 'wb') as f:
+                    async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                        digest.update(chunk)
+                        f.write(chunk)
+                        size += len(chunk)
+        return _store(tmp_path, digest, size, url_key)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def fetch_image(url):
+    """Returns the content hash of the image at url, downloading it only on a cache miss."""
+    url_key = _url_key(url)
+    content_hash = _lookup(url_key)
+    if content_hash is None:
+        content_hash = _download(url, url_key)
+    return content_hash
+
+
+async def fetch_image_async(url, client):
+    """fetch_image for the ASGI app, downloading through an httpx.AsyncClient."""
+    url_key = _url_key(url)
+    content_hash = _lookup(url_key)
+    if content_hash is None:
+        content_hash = await _download_async(url, url_key, client)
+    return content_hash
+
+
+def image_base64(content_hash):
+    with open(blob_path(content_hash), 'rb') as f:
+        return base64.b64encode(f.read()).decode('utf-8')
+
+
+def pic_fields_for_hash(content_hash, mode=None):
+    if (mode or PROFILE_PIC_MODE) == 'url':
+        return {'profile_pic_hash': content_hash, 'profile_pic_cached_url': f"/media/pic/{content_hash}"}
+    return {'profile_pic_base64': image_base64(content_hash)}
+
+
+def missing_pic_fields(mode=None):
+    """pic_fields_for_hash for a picture that couldn't be fetched."""
+    if (mode or PROFILE_PIC_MODE) == 'url':
+        return {'profile_pic_hash': None, 'profile_pic_cached_url': None}
+    return {'profile_pic_base64': None}
+
+
+def profile_pic_fields(url, mode=None):
+    """Response fields for a profile picture, inlined or as a cacheable link. Null if it can't be fetched."""
+    try:
+        return pic_fields_for_hash(fetch_image(url), mode)
+    except PIC_FETCH_ERRORS as e:
+        logger.warning(f"Profile picture {url} could not be fetched: {str(e)}")
+        return missing_pic_fields(mode)
@@ -0,0 +1,308 @@
+import os
+import json
+import time
+import uuid
+import inspect
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Job queue configuration, overridable from the environment
+JOB_DB_PATH = os.getenv('JOB_DB_PATH', '.cache/jobs.sqlite3')
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+JOB_RESULT_TTL = int(os.getenv('JOB_RESULT_TTL', '3600'))
+JOB_RETRY_BACKOFF = float(os.getenv('JOB_RETRY_BACKOFF', '5'))
+# A running job whose heartbeat is older than this is assumed orphaned by a dead worker
+JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', '300'))
+# Workers renew the lease of the job they are running this often, however long the handler takes
+JOB_HEARTBEAT_INTERVAL = JOB_LEASE_SECONDS / 3
+
+POLL_INTERVAL = 0.5
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATUSES = (SUCCEEDED, FAILED, CANCELLED)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    type TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    progress TEXT,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    run_after REAL NOT NULL,
+    expires_at REAL
+);
+CREATE INDEX IF NOT EXISTS ix_jobs_status_run_after ON jobs (status, run_after);
+CREATE INDEX IF NOT EXISTS ix_jobs_expires_at ON jobs (expires_at);
+"""
+
+
+class JobCancelled(Exception):
+    """Raised inside a handler once its job has been cancelled."""
+
+
+class JobContext:
+    """Handed to job handlers so they can report progress and notice cancellation."""
+
+    def __init__(self, queue, job_id):
+        self.queue = queue
+        self.job_id = job_id
+
+    def progress(self, step, **details):
+        """Records progress and raises JobCancelled if the job was cancelled meanwhile."""
+        if self.queue.status(self.job_id) == CANCELLED:
+            raise JobCancelled(self.job_id)
+        self.queue._update(self.job_id, progress=json.dumps(dict(details, step=step)))
+
+
+class JobQueue:
+    """Durable background job queue backed by SQLite, drained by local worker threads.
+
+    The SQLite file is shared by every gunicorn worker on the host, so a job
+    submitted in one process can be polled from another, and jobs left
+    running by a dead process are picked up again once their lease expires.
+    """
+
+    def __init__(self, path=JOB_DB_PATH):
+        self.path = path
+        self.handlers = {}
+        self._threads = []
+        self._stop = threading.Event()
+        self._app = None
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        # Autocommit connection; multi-statement transactions use explicit BEGIN/COMMIT
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _update(self, job_id, **fields):
+        fields['updated_at'] = time.time()
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def register(self, job_type, handler):
+        """Registers handler(context, **params) as the implementation of job_type.
+
+        The handler's keyword arguments are the params a job of this type accepts.
+        """
+        self.handlers[job_type] = handler
+
+    def _check_params(self, job_type, params):
+        arguments = list(inspect.signature(self.handlers[job_type]).parameters.values())[1:]
+        unknown = sorted(set(params) - {argument.name for argument in arguments})
+        if unknown:
+            raise ValueError(f"Unknown params for {job_type} jobs: {', '.join(unknown)}")
+        missing = [argument.name for argument in arguments
+                   if argument.default is inspect.Parameter.empty and argument.name not in params]
+        if missing:
+            raise ValueError(f"Missing params for {job_type} jobs: {', '.join(missing)}")
+
+    def submit(self, job_type, params, max_attempts=JOB_MAX_ATTEMPTS):
+        if job_type not in self.handlers:
+            raise ValueError(f"Unknown job type: {job_type}")
+        self._check_params(job_type, params)
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, type, params, status, max_attempts, created_at, updated_at, run_after) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, job_type, json.dumps(params), QUEUED, max_attempts, now, now, now),
+            )
+        return job_id
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            'id': row['id'],
+            'type': row['type'],
+            'params': json.loads(row['params']),
+            'status': row['status'],
+            'attempts': row['attempts'],
+            'max_attempts': row['max_attempts'],
+            'progress': json.loads(row['progress']) if row['progress'] else None,
+            'result': json.loads(row['result']) if row['result'] else None,
+            'error': row['error'],
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at'],
+            'expires_at': row['expires_at'],
+        }
+
+    def status(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row['status'] if row else None
+
+    def cancel(self, job_id):
+        """Cancels a queued or running job. Returns False if it had already finished."""
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ?, expires_at = ? WHERE id = ? AND status IN (?, ?)",
+                (CANCELLED, now, now + JOB_RESULT_TTL, job_id, QUEUED, RUNNING),
+            )
+        return cursor.rowcount > 0
+
+    def _claim(self):
+        """Atomically moves the oldest runnable job to running and returns it."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            # Jobs orphaned by a worker that died mid-run: fail those out of attempts, so a job
+            # that kills its worker isn't retried forever, and requeue the rest
+            stale = now - JOB_LEASE_SECONDS
+            failed = conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ?, expires_at = ? "
+                "WHERE status = ? AND updated_at < ? AND attempts >= max_attempts",
+                (FAILED, 'Lease expired: the worker running the job stopped', now, now + JOB_RESULT_TTL, RUNNING, stale),
+            ).rowcount
+            if failed:
+                logger.error(f"Failed {failed} job(s) whose lease expired on their last attempt")
+            conn.execute(
+                "UPDATE jobs SET status = ? WHERE status = ? AND updated_at < ?",
+                (QUEUED, RUNNING, stale),
+            )
+            row = conn.execute(
+                "SELECT id, type, params, attempts, max_attempts FROM jobs "
+                "WHERE status = ? AND run_after <= ? ORDER BY created_at LIMIT 1",
+                (QUEUED, now),
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    (RUNNING, now, row['id']),
+                )
+            conn.execute('COMMIT')
+            return row
+
+    def _purge_expired(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM jobs WHERE expires_at IS NOT NULL AND expires_at < ?", (time.time(),))
+
+    def _finish(self, job_id, status, result=None, error=None):
+        now = time.time()
+        with self._connect() as conn:
+            # Never overwrite a cancellation that landed while the handler was running
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ?, expires_at = ? "
+                "WHERE id = ? AND status = ?",
+                (status, result, error, now, now + JOB_RESULT_TTL, job_id, RUNNING),
+            )
+
+    def _heartbeat(self, job_id, done):
+        """Renews the lease of a running job until done is set, so a long handler isn't requeued."""
+        while not done.wait(JOB_HEARTBEAT_INTERVAL):
+            try:
+                with self._connect() as conn:
+                    conn.execute("UPDATE jobs SET updated_at = ? WHERE id = ? AND status = ?",
+                                 (time.time(), job_id, RUNNING))
+            except Exception as e:
+                logger.warning(f"Could not renew the lease of job {job_id}: {str(e)}")
+
+    def _run(self, row):
+        job_id = row['id']
+        handler = self.handlers.get(row['type'])
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job_id, done), name=f"job-heartbeat-{job_id}", daemon=True)
+        heartbeat.start()
+        try:
+            if handler is None:
+                raise ValueError(f"No handler registered for job type {row['type']}")
+            context = JobContext(self, job_id)
+            if self._app is not None:
+                with self._app.app_context():
+                    result = handler(context, **json.loads(row['params']))
+            else:
+                result = handler(context, **json.loads(row['params']))
+            self._finish(job_id, SUCCEEDED, result=json.dumps(result))
+        except JobCancelled:
+            logger.info(f"Job {job_id} was cancelled.")
+        except Exception as e:
+            attempts = row['attempts'] + 1
+            if attempts < row['max_attempts']:
+                delay = JOB_RETRY_BACKOFF * 2 ** (attempts - 1)
+                logger.warning(f"Job {job_id} failed (attempt {attempts}), retrying in {delay}s: {str(e)}")
+                with self._connect() as conn:
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, error = ?, run_after = ?, updated_at = ? WHERE id = ? AND status = ?",
+                        (QUEUED, str(e), time.time() + delay, time.time(), job_id, RUNNING),
+                    )
+            else:
+                logger.error(f"Job {job_id} failed after {attempts} attempts: {str(e)}")
+                self._finish(job_id, FAILED, error=str(e))
+        finally:
+            done.set()
+
+    def _work(self):
+        last_purge = 0.0
+        while not self._stop.is_set():
+            try:
+                if time.time() - last_purge > 60:
+                    self._purge_expired()
+                    last_purge = time.time()
+                row = self._claim()
+            except Exception as e:
+                logger.error(f"Job queue poll failed: {str(e)}")
+                row = None
+            if row is None:
+                self._stop.wait(POLL_INTERVAL)
+                continue
+            self._run(row)
+
+    def start(self, app=None, workers=JOB_WORKERS):
+        """Starts the worker threads. Handlers run inside app's context when one is given."""
+        if self._threads:
+            return
+        self._app = app
+        for index in range(workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS count FROM jobs GROUP BY status").fetchall()
+        data = {row['status']: row['count'] for row in rows}
+        data['workers'] = len(self._threads)
+        return data
+
+
+job_queue = JobQueue()
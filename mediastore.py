@@ -0,0 +1,107 @@
+import os
+import logging
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Media
+from upstream import fetch_media_info
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables from .env file
+load_dotenv()
+
+# How long stored like/comment counts are served before media_info is called again
+MEDIA_COUNTS_TTL = int(os.getenv('MEDIA_COUNTS_TTL', '900'))
+
+
+def _media_dict(row):
+    return {
+        'pk': row.pk,
+        'code': row.code,
+        'owner_pk': row.owner_pk,
+        'username': row.owner_username,
+        'full_name': row.owner_full_name,
+        'profile_pic_url': row.owner_profile_pic_url,
+        'caption': row.caption,
+        'media_type': row.media_type,
+        'location': row.location_name,
+        'like_count': row.like_count,
+        'comment_count': row.comment_count,
+        'counts_updated_at': row.counts_updated_at,
+    }
+
+
+def _store(media_pk, media):
+    """Inserts or refreshes the stored row for an instagrapi Media object."""
+    now = datetime.utcnow()
+    row = Media.query.get(str(media_pk))
+    if row is None:
+        row = Media(
+            pk=str(media_pk),
+            code=media.code,
+            owner_pk=str(media.user.pk),
+            owner_username=media.user.username,
+            owner_full_name=media.user.full_name,
+            caption=media.caption_text,
+            media_type=media.media_type,
+            location_name=media.location.name if media.location else None,
+            taken_at=media.taken_at,
+            created_at=now,
+        )
+        db.session.add(row)
+    row.like_count = media.like_count
+    row.comment_count = media.comment_count
+    row.owner_profile_pic_url = str(media.user.profile_pic_url) if media.user.profile_pic_url else None
+    row.counts_updated_at = now
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another worker stored the same post first; its row is just as good
+        db.session.rollback()
+        row = Media.query.get(str(media_pk))
+    return row
+
+
+def media_summary(media_pk, counts=True, bypass=False):
+    """Post fields as a dict, served from the Media table whenever possible.
+
+    With counts=False only immutable fields are needed, so a known post never
+    goes upstream. Otherwise the stored counters are used while younger than
+    MEDIA_COUNTS_TTL, and refreshed from media_info once they are older.
+    """
+    media_pk = str(media_pk)
+    row = None if bypass else Media.query.get(media_pk)
+    if row is not None:
+        fresh = row.counts_updated_at and datetime.utcnow() - row.counts_updated_at < timedelta(seconds=MEDIA_COUNTS_TTL)
+        if not counts or fresh:
+            return _media_dict(row)
+
+    media = fetch_media_info(media_pk, bypass=bypass)
+    try:
+        row = _store(media_pk, media)
+    except Exception as e:
+        db.session.rollback()
+        logger.warning(f"Could not store media {media_pk}: {str(e)}")
+        row = None
+    if row is not None:
+        return _media_dict(row)
+
+    # Storage failed; answer from the upstream object rather than failing the request
+    return {
+        'pk': media_pk,
+        'code': media.code,
+        'owner_pk': str(media.user.pk),
+        'username': media.user.username,
+        'full_name': media.user.full_name,
+        'profile_pic_url': str(media.user.profile_pic_url) if media.user.profile_pic_url else None,
+        'caption': media.caption_text,
+        'media_type': media.media_type,
+        'location': media.location.name if media.location else None,
+        'like_count': media.like_count,
+        'comment_count': media.comment_count,
+        'counts_updated_at': datetime.utcnow(),
+    }
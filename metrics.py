@@ -0,0 +1,373 @@
+import os
+import sys
+import hmac
+import time
+import logging
+import threading
+from collections import Counter as StackCounter
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Sampling profiler for ?profile=1, overridable from the environment. It costs a thread and a
+# file per request, so it is off unless enabled, and PROFILE_TOKEN (when set) must also be sent
+# as the X-Profile-Token header.
+PROFILE_ENABLED = os.getenv('PROFILE_ENABLED', '0') == '1'
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN')
+PROFILE_DIR = os.getenv('PROFILE_DIR', '.cache/profiles')
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', '0.005'))
+# Requests faster than this are not worth a profile file
+PROFILE_MIN_SECONDS = float(os.getenv('PROFILE_MIN_SECONDS', '0'))
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', '50'))
+
+# Latency buckets in seconds, from cache hits up to slow upstream fan-outs
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple((name, labels.get(name, '')) for name in self.labelnames)
+
+    def samples(self):
+        """(suffix, labels, value) triples for the text exposition."""
+        with self._lock:
+            return [('', key, value) for key, value in self._values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][index] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+
+    def samples(self):
+        with self._lock:
+            values = [(key, list(state['counts']), state['sum'], state['count']) for key, state in self._values.items()]
+        samples = []
+        for key, counts, total, count in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                samples.append(('_bucket', key + (('le', _format_value(float(bound))),), cumulative))
+            samples.append(('_sum', key, round(total, 6)))
+            samples.append(('_count', key, count))
+        return samples
+
+
+class Registry:
+    """Holds every metric of the process and renders them in Prometheus text format.
+
+    Collectors are callables invoked at scrape time that return extra metrics,
+    for state that already lives elsewhere (cache counters, pool sizes, ...).
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def register_collector(self, collector):
+        self.collectors.append(collector)
+        return collector
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            try:
+                for metric in collector():
+                    lines.extend(metric.render())
+            except Exception as e:
+                logger.warning(f"Metrics collector {getattr(collector, '__name__', collector)} failed: {str(e)}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+http_requests = registry.counter(
+    'http_requests_total', 'HTTP requests handled, by route, method and status.', ('route', 'method', 'status'))
+http_latency = registry.histogram(
+    'http_request_duration_seconds', 'Time to produce the HTTP response, by route.', ('route', 'method'))
+http_in_flight = registry.gauge(
+    'http_requests_in_flight', 'HTTP requests currently being handled, by route.', ('route',))
+
+upstream_calls = registry.counter(
+    'upstream_calls_total', 'Calls made to Instagram, by instagrapi method.', ('method',))
+upstream_errors = registry.counter(
+    'upstream_errors_total', 'Failed calls to Instagram, by instagrapi method and exception.', ('method', 'error'))
+upstream_latency = registry.histogram(
+    'upstream_call_duration_seconds', 'Latency of calls to Instagram, by instagrapi method.', ('method',))
+upstream_in_flight = registry.gauge(
+    'upstream_calls_in_flight', 'Calls to Instagram currently waiting on a response.', ('method',))
+
+db_queries = registry.counter(
+    'db_queries_total', 'SQL statements executed, by statement kind.', ('operation',))
+db_errors = registry.counter(
+    'db_query_errors_total', 'SQL statements that raised, by statement kind.', ('operation',))
+db_latency = registry.histogram(
+    'db_query_duration_seconds', 'Time spent executing SQL statements, by statement kind.', ('operation',))
+
+cache_lookups = registry.counter(
+    'cache_lookups_total', 'Upstream cache lookups, by namespace and result (hit, miss, bypass).', ('namespace', 'result'))
+
+
+@contextmanager
+def upstream_call(method):
+    """Records the latency and outcome of the block under the given instagrapi method name."""
+    upstream_calls.inc(method=method)
+    upstream_in_flight.inc(method=method)
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        upstream_errors.inc(method=method, error=type(e).__name__)
+        raise
+    finally:
+        upstream_latency.observe(time.perf_counter() - start, method=method)
+        upstream_in_flight.dec(method=method)
+
+
+def observe_upstream(method, fn, *args, **kwargs):
+    """Calls fn, recording its latency and outcome under the given instagrapi method name."""
+    with upstream_call(method):
+        return fn(*args, **kwargs)
+
+
+def _statement_operation(statement):
+    words = statement.lstrip().split(None, 1)
+    operation = words[0].upper() if words else ''
+    return operation if operation in ('SELECT', 'INSERT', 'UPDATE', 'DELETE') else 'OTHER'
+
+
+def instrument_sqlalchemy():
+    """Times every SQL statement through engine events, for every engine in the process."""
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    if event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        return
+
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(Engine, 'handle_error', _handle_error)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    operation = _statement_operation(statement)
+    db_queries.inc(operation=operation)
+    db_latency.observe(time.perf_counter() - conn.info['query_start'].pop(), operation=operation)
+
+
+def _handle_error(exception_context):
+    operation = _statement_operation(exception_context.statement or '')
+    db_queries.inc(operation=operation)
+    db_errors.inc(operation=operation)
+    starts = exception_context.connection.info.get('query_start') if exception_context.connection is not None else None
+    if starts:
+        db_latency.observe(time.perf_counter() - starts.pop(), operation=operation)
+
+
+class StackSampler:
+    """Samples one thread's call stack at a fixed interval while a request runs.
+
+    Stacks are counted in the folded format ("outer;inner;leaf count") that
+    flamegraph.pl and speedscope read directly. Sampling from a side thread
+    keeps the overhead flat no matter how many calls the request makes.
+    """
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = StackCounter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sample, name='stack-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def save(self, name):
+        """Writes the folded stacks under PROFILE_DIR and returns the file path."""
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{int(time.time() * 1000)}-{name}.folded")
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        _prune_profiles()
+        return path
+
+
+def _prune_profiles():
+    try:
+        files = sorted(os.listdir(PROFILE_DIR))
+    except OSError:
+        return
+    for name in files[:-PROFILE_KEEP] if PROFILE_KEEP > 0 else []:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, name))
+        except OSError:
+            pass
+
+
+def instrument_app(app):
+    """Records per-route latency, status counts and in-flight requests, and serves ?profile=1."""
+    from flask import g, request
+
+    def profile_requested():
+        if not PROFILE_ENABLED or request.args.get('profile') != '1':
+            return False
+        return PROFILE_TOKEN is None or hmac.compare_digest(request.headers.get('X-Profile-Token', ''), PROFILE_TOKEN)
+
+    def route_label():
+        return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+    @app.before_request
+    def start_request_metrics():
+        g.metrics_route = route_label()
+        g.metrics_start = time.perf_counter()
+        http_in_flight.inc(route=g.metrics_route)
+        if profile_requested():
+            g.metrics_sampler = StackSampler(threading.get_ident()).start()
+
+    @app.after_request
+    def record_request_metrics(response):
+        route = g.get('metrics_route')
+        if route is None:
+            return response
+        elapsed = time.perf_counter() - g.metrics_start
+        http_latency.observe(elapsed, route=route, method=request.method)
+        http_requests.inc(route=route, method=request.method, status=str(response.status_code))
+
+        sampler = g.pop('metrics_sampler', None)
+        if sampler is not None:
+            sampler.stop()
+            if elapsed >= PROFILE_MIN_SECONDS:
+                name = route.strip('/').replace('/', '_').replace('<', '').replace('>', '') or 'root'
+                path = sampler.save(name)
+                response.headers['X-Profile-File'] = os.path.basename(path)
+                logger.info(f"Saved profile of {request.path} ({elapsed:.3f}s) to {path}")
+        return response
+
+    @app.teardown_request
+    def finish_request_metrics(exc):
+        route = g.pop('metrics_route', None)
+        if route is not None:
+            http_in_flight.dec(route=route)
+        sampler = g.pop('metrics_sampler', None)
+        if sampler is not None:
+            sampler.stop()
+
+
+def render():
+    return registry.render()
@@ -0,0 +1,20 @@
+import logging
+
+from app import create_app
+from models import db
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    """Creates any missing tables. Run once per deploy, before the web workers start."""
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+    logger.info("Database schema is up to date.")
+
+
+if __name__ == '__main__':
+    main()
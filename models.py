@@ -1,4 +1,6 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql
 from datetime import datetime
 import random
 import smtplib
@@ -17,6 +19,184 @@ class Influencer(db.Model):
     def __repr__(self):
         return f'<Influencer {self.username}>'
 
+class InfluencerSnapshot(db.Model):
+    """Append-only history of an influencer's counts, one row per observation."""
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    username = db.Column(db.String(150), nullable=False)
+    ts = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    followers = db.Column(db.Integer, nullable=False)
+    following = db.Column(db.Integer, nullable=False)
+    media_count = db.Column(db.Integer)
+    engagement = db.Column(db.Float)
+
+    __table_args__ = (
+        db.Index('ix_influencer_snapshot_username_ts', 'username', 'ts'),
+    )
+
+    def __repr__(self):
+        return f'<InfluencerSnapshot {self.username} @ {self.ts}>'
+
+class Media(db.Model):
+    """Posts we have already resolved, so known URLs don't need another media_info call.
+
+    Owner, caption, type and location never change for a post; the counters
+    and the (signed, expiring) owner picture URL are refreshed on a TTL.
+    """
+    pk = db.Column(db.String(32), primary_key=True)
+    code = db.Column(db.String(64), unique=True, index=True, nullable=False)
+    owner_pk = db.Column(db.String(32))
+    owner_username = db.Column(db.String(150), index=True)
+    owner_full_name = db.Column(db.String(255))
+    owner_profile_pic_url = db.Column(db.Text)
+    caption = db.Column(db.Text)
+    media_type = db.Column(db.Integer)
+    location_name = db.Column(db.String(255))
+    like_count = db.Column(db.Integer)
+    comment_count = db.Column(db.Integer)
+    taken_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    counts_updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<Media {self.code}>'
+
+class OtpMessage(db.Model):
+    """One OTP and the DM that delivers it, drained by the outbox dispatcher.
+
+    Only a salted hash of the code is kept. The DM text, which necessarily
+    contains the code, is cleared once the message is sent or gives up.
+    """
+    id = db.Column(db.String(32), primary_key=True)
+    username = db.Column(db.String(150), nullable=False)
+    user_pk = db.Column(db.String(32), nullable=False)
+    otp_hash = db.Column(db.String(128), nullable=False)
+    message = db.Column(db.Text)
+    status = db.Column(db.String(16), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    verify_attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # When the dispatcher may next pick the row up; doubles as the lease of a row being sent
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    verified_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_otp_message_status_next_attempt', 'status', 'next_attempt_at'),
+        db.Index('ix_otp_message_username_created', 'username', 'created_at'),
+    )
+
+    def __repr__(self):
+        return f'<OtpMessage {self.username} {self.status}>'
+
+# Function to insert or update many influencers in one statement
+def bulk_upsert_influencers(rows):
+    """Upserts dicts of username/followers/following/updated_at, keyed on username."""
+    if not rows:
+        return
+    table = Influencer.__table__
+    if db.engine.dialect.name == 'postgresql':
+        stmt = postgresql.insert(table).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.username],
+            set_={
+                'followers': stmt.excluded.followers,
+                'following': stmt.excluded.following,
+                'updated_at': stmt.excluded.updated_at,
+            },
+        )
+        db.session.execute(stmt)
+    else:
+        # Other backends (e.g. SQLite in local benchmarks) fall back to row-by-row merges
+        existing = {
+            influencer.username: influencer
+            for influencer in Influencer.query.filter(Influencer.username.in_([row['username'] for row in rows]))
+        }
+        for row in rows:
+            influencer = existing.get(row['username'])
+            if influencer:
+                influencer.followers = row['followers']
+                influencer.following = row['following']
+                influencer.updated_at = row['updated_at']
+            else:
+                db.session.add(Influencer(**row))
+    db.session.commit()
+
+# Function to append many snapshots in one round trip
+def bulk_insert_snapshots(rows):
+    if not rows:
+        return
+    db.session.execute(InfluencerSnapshot.__table__.insert(), rows)
+    db.session.commit()
+
+# Function to read a downsampled follower history
+def snapshot_history(username, start, end, bucket='day'):
+    """Per-bucket averages for username between start and end, computed in SQL.
+
+    bucket is 'day', 'week' or 'raw' (every snapshot, no aggregation).
+    """
+    query_filter = (
+        InfluencerSnapshot.username == username,
+        InfluencerSnapshot.ts >= start,
+        InfluencerSnapshot.ts < end,
+    )
+    if bucket == 'raw':
+        rows = (
+            InfluencerSnapshot.query.filter(*query_filter)
+            .order_by(InfluencerSnapshot.ts)
+            .all()
+        )
+        return [
+            {
+                'ts': row.ts.isoformat(),
+                'followers': row.followers,
+                'following': row.following,
+                'media_count': row.media_count,
+                'engagement': row.engagement,
+            }
+            for row in rows
+        ]
+
+    if db.engine.dialect.name == 'postgresql':
+        bucket_start = func.date_trunc(bucket, InfluencerSnapshot.ts)
+    elif bucket == 'week':
+        # SQLite: back up to the Monday of the snapshot's week
+        bucket_start = func.date(InfluencerSnapshot.ts, 'weekday 0', '-6 days')
+    else:
+        bucket_start = func.date(InfluencerSnapshot.ts)
+    bucket_start = bucket_start.label('bucket')
+
+    rows = (
+        db.session.query(
+            bucket_start,
+            func.avg(InfluencerSnapshot.followers),
+            func.min(InfluencerSnapshot.followers),
+            func.max(InfluencerSnapshot.followers),
+            func.avg(InfluencerSnapshot.following),
+            func.max(InfluencerSnapshot.media_count),
+            func.avg(InfluencerSnapshot.engagement),
+            func.count(InfluencerSnapshot.id),
+        )
+        .filter(*query_filter)
+        .group_by(bucket_start)
+        .order_by(bucket_start)
+        .all()
+    )
+    return [
+        {
+            'bucket': bucket_value.isoformat() if hasattr(bucket_value, 'isoformat') else str(bucket_value),
+            'followers': round(float(followers)),
+            'followers_min': followers_min,
+            'followers_max': followers_max,
+            'following': round(float(following)),
+            'media_count': media_count,
+            'engagement': round(float(engagement), 4) if engagement is not None else None,
+            'samples': samples,
+        }
+        for bucket_value, followers, followers_min, followers_max, following, media_count, engagement, samples in rows
+    ]
+
 # Function to generate a 6-digit OTP
 def generate_otp():
     return random.randint(100000, 999999)
@@ -0,0 +1,283 @@
+import os
+import hmac
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+
+from models import db, OtpMessage, generate_otp
+from ratelimit import RateBudgetExceeded
+from sessionpool import PoolExhausted
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables from .env file
+load_dotenv()
+
+# OTP and outbox configuration, overridable from the environment
+OTP_TTL = int(os.getenv('OTP_TTL', '600'))
+# A repeat request for the same user within this window reuses the pending OTP instead of sending another DM
+OTP_DEDUPE_WINDOW = int(os.getenv('OTP_DEDUPE_WINDOW', '120'))
+OTP_MAX_VERIFY_ATTEMPTS = int(os.getenv('OTP_MAX_VERIFY_ATTEMPTS', '5'))
+OTP_HASH_ITERATIONS = int(os.getenv('OTP_HASH_ITERATIONS', '20000'))
+# Returning the code in the /profile response defeats the DM, so it is only for dev and benchmarks
+OTP_ECHO = os.getenv('OTP_ECHO', '0') == '1'
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '5'))
+OUTBOX_RETRY_BACKOFF = float(os.getenv('OUTBOX_RETRY_BACKOFF', '10'))
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '20'))
+OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', '2'))
+# A row claimed by a dispatcher that died mid-send is picked up again after this long
+OUTBOX_LEASE_SECONDS = int(os.getenv('OUTBOX_LEASE_SECONDS', '120'))
+OUTBOX_RETENTION = int(os.getenv('OUTBOX_RETENTION', str(7 * 24 * 3600)))
+
+QUEUED = 'queued'
+SENDING = 'sending'
+SENT = 'sent'
+FAILED = 'failed'
+EXPIRED = 'expired'
+# A recent OTP in one of these states suppresses a new one for the same user
+DEDUPE_STATUSES = (QUEUED, SENDING, SENT)
+# Errors that mean "not now" rather than "this message failed"; they don't count as attempts
+DEFER_ERRORS = (RateBudgetExceeded, PoolExhausted)
+
+
+def hash_otp(otp, iterations=OTP_HASH_ITERATIONS):
+    """Salted PBKDF2 hash of an OTP, as iterations$salt$digest."""
+    salt = os.urandom(16)
+    digest = hashlib.pbkdf2_hmac('sha256', str(otp).encode('utf-8'), salt, iterations)
+    return f"{iterations}${salt.hex()}${digest.hex()}"
+
+
+def check_otp(otp, otp_hash):
+    iterations, salt, digest = otp_hash.split('$')
+    candidate = hashlib.pbkdf2_hmac('sha256', str(otp).encode('utf-8'), bytes.fromhex(salt), int(iterations))
+    return hmac.compare_digest(candidate.hex(), digest)
+
+
+def normalize_username(username):
+    # Instagram usernames are case-insensitive, and users type them however they like
+    return str(username).strip().lower()
+
+
+def describe(row):
+    """Public view of an outbox row; never includes the code or the DM text."""
+    return {
+        'id': row.id,
+        'username': row.username,
+        'status': row.status,
+        'attempts': row.attempts,
+        'error': row.last_error,
+        'created_at': row.created_at.isoformat(),
+        'sent_at': row.sent_at.isoformat() if row.sent_at else None,
+        'expires_at': row.expires_at.isoformat(),
+        'verified': row.verified_at is not None,
+    }
+
+
+class OtpOutbox:
+    """Persistent outbox of OTP DMs, drained in the background under the DM rate budget.
+
+    Rows live in the main database, so every gunicorn worker (on any host)
+    runs a dispatcher; a row is claimed with a conditional UPDATE before it
+    is sent, so only one dispatcher delivers it. send_fn(text, user_pk)
+    performs the actual DM.
+    """
+
+    def __init__(self, send_fn):
+        self.send_fn = send_fn
+        self._app = None
+        self._thread = None
+        self._wake = threading.Event()
+        self.sent = 0
+        self.failed = 0
+        self.deferred = 0
+        self.deduplicated = 0
+
+    def enqueue(self, username, user_pk, display_name):
+        """Queues an OTP DM for a user. Returns (message, otp), with otp None for a deduplicated request."""
+        username = normalize_username(username)
+        now = datetime.utcnow()
+        recent = (
+            OtpMessage.query.filter(
+                OtpMessage.username == username,
+                OtpMessage.created_at >= now - timedelta(seconds=OTP_DEDUPE_WINDOW),
+                OtpMessage.status.in_(DEDUPE_STATUSES),
+                OtpMessage.expires_at > now,
+                OtpMessage.verified_at.is_(None),
+            )
+            .order_by(OtpMessage.created_at.desc())
+            .first()
+        )
+        if recent is not None:
+            self.deduplicated += 1
+            return describe(recent), None
+
+        otp = generate_otp()
+        row = OtpMessage(
+            id=uuid.uuid4().hex,
+            username=username,
+            user_pk=str(user_pk),
+            otp_hash=hash_otp(otp),
+            message=f"Hello {display_name}, your OTP is: {otp}",
+            status=QUEUED,
+            created_at=now,
+            next_attempt_at=now,
+            expires_at=now + timedelta(seconds=OTP_TTL),
+        )
+        db.session.add(row)
+        db.session.commit()
+        # Let the local dispatcher send it now rather than on its next poll
+        self._wake.set()
+        return describe(row), otp
+
+    def get(self, message_id):
+        row = OtpMessage.query.get(message_id)
+        return describe(row) if row is not None else None
+
+    def verify(self, username, otp):
+        """Checks an OTP against the user's latest live code. Returns (verified, reason)."""
+        username = normalize_username(username)
+        now = datetime.utcnow()
+        row = (
+            OtpMessage.query.filter(
+                OtpMessage.username == username,
+                OtpMessage.status.in_(DEDUPE_STATUSES),
+                OtpMessage.expires_at > now,
+                OtpMessage.verified_at.is_(None),
+            )
+            .order_by(OtpMessage.created_at.desc())
+            .first()
+        )
+        if row is None:
+            return False, 'No active OTP for this user.'
+        if row.verify_attempts >= OTP_MAX_VERIFY_ATTEMPTS:
+            return False, 'Too many attempts.'
+        row.verify_attempts += 1
+        verified = check_otp(otp, row.otp_hash)
+        if verified:
+            row.verified_at = now
+        db.session.commit()
+        return verified, None if verified else 'Invalid OTP.'
+
+    def _set(self, message_id, **values):
+        db.session.execute(OtpMessage.__table__.update().where(OtpMessage.id == message_id).values(**values))
+        db.session.commit()
+
+    def _claim(self):
+        """Moves up to OUTBOX_BATCH_SIZE due rows to sending, skipping any another dispatcher took first."""
+        now = datetime.utcnow()
+        table = OtpMessage.__table__
+        candidates = (
+            db.session.query(OtpMessage.id, OtpMessage.status, OtpMessage.next_attempt_at)
+            .filter(OtpMessage.status.in_((QUEUED, SENDING)), OtpMessage.next_attempt_at <= now)
+            .order_by(OtpMessage.next_attempt_at)
+            .limit(OUTBOX_BATCH_SIZE)
+            .all()
+        )
+        claimed = []
+        for message_id, status, next_attempt_at in candidates:
+            result = db.session.execute(
+                table.update()
+                .where(table.c.id == message_id)
+                .where(table.c.status == status)
+                .where(table.c.next_attempt_at == next_attempt_at)
+                .values(status=SENDING, next_attempt_at=now + timedelta(seconds=OUTBOX_LEASE_SECONDS))
+            )
+            if result.rowcount:
+                claimed.append(message_id)
+        db.session.commit()
+        if not claimed:
+            return []
+        return (
+            db.session.query(OtpMessage.id, OtpMessage.user_pk, OtpMessage.message, OtpMessage.attempts, OtpMessage.expires_at)
+            .filter(OtpMessage.id.in_(claimed))
+            .order_by(OtpMessage.created_at)
+            .all()
+        )
+
+    def _deliver(self, message_id, user_pk, message, attempts, expires_at):
+        """Sends one claimed message. Returns False if the DM budget is exhausted for now."""
+        now = datetime.utcnow()
+        if expires_at <= now or not message:
+            self._set(message_id, status=EXPIRED, message=None)
+            return True
+        try:
+            self.send_fn(message, user_pk)
+        except DEFER_ERRORS as e:
+            self.deferred += 1
+            self._set(message_id, status=QUEUED, last_error=str(e),
+                      next_attempt_at=now + timedelta(seconds=OUTBOX_RETRY_BACKOFF))
+            return False
+        except Exception as e:
+            attempts += 1
+            if attempts >= OUTBOX_MAX_ATTEMPTS:
+                self.failed += 1
+                logger.error(f"OTP message {message_id} failed after {attempts} attempts: {str(e)}")
+                self._set(message_id, status=FAILED, attempts=attempts, last_error=str(e), message=None)
+            else:
+                delay = OUTBOX_RETRY_BACKOFF * 2 ** (attempts - 1)
+                logger.warning(f"OTP message {message_id} failed (attempt {attempts}), retrying in {delay}s: {str(e)}")
+                self._set(message_id, status=QUEUED, attempts=attempts, last_error=str(e),
+                          next_attempt_at=now + timedelta(seconds=delay))
+            return True
+        self.sent += 1
+        self._set(message_id, status=SENT, attempts=attempts + 1, last_error=None, message=None,
+                  sent_at=datetime.utcnow())
+        return True
+
+    def _purge(self):
+        cutoff = datetime.utcnow() - timedelta(seconds=OUTBOX_RETENTION)
+        OtpMessage.query.filter(OtpMessage.created_at < cutoff).delete(synchronize_session=False)
+        db.session.commit()
+
+    def run_once(self):
+        """Claims and sends one batch. Returns the number of rows claimed."""
+        with self._app.app_context():
+            batch = self._claim()
+            for index, item in enumerate(batch):
+                if not self._deliver(*item):
+                    # Out of DM budget: hand the rest of the batch back instead of holding its lease
+                    for message_id, *_ in batch[index + 1:]:
+                        self._set(message_id, status=QUEUED,
+                                  next_attempt_at=datetime.utcnow() + timedelta(seconds=OUTBOX_RETRY_BACKOFF))
+                    break
+            return len(batch)
+
+    def _run(self):
+        last_purge = 0.0
+        while True:
+            try:
+                if time.time() - last_purge > 600:
+                    with self._app.app_context():
+                        self._purge()
+                    last_purge = time.time()
+                claimed = self.run_once()
+            except Exception as e:
+                logger.error(f"OTP outbox dispatch failed: {str(e)}")
+                claimed = 0
+            if not claimed:
+                self._wake.wait(OUTBOX_POLL_INTERVAL)
+                self._wake.clear()
+
+    def start(self, app):
+        if self._thread is not None:
+            return
+        self._app = app
+        self._thread = threading.Thread(target=self._run, name='otp-outbox', daemon=True)
+        self._thread.start()
+
+    def stats(self):
+        rows = db.session.query(OtpMessage.status, db.func.count(OtpMessage.id)).group_by(OtpMessage.status).all()
+        return {
+            'messages': {status: count for status, count in rows},
+            'sent': self.sent,
+            'failed': self.failed,
+            'deferred': self.deferred,
+            'deduplicated': self.deduplicated,
+            'dispatcher': self._thread is not None,
+        }
@@ -0,0 +1,55 @@
+import os
+import json
+import base64
+
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Page size limits for liker and comment listings
+DEFAULT_PAGE_SIZE = int(os.getenv('PAGE_SIZE_DEFAULT', '100'))
+MAX_PAGE_SIZE = int(os.getenv('PAGE_SIZE_MAX', '1000'))
+
+
+class InvalidCursor(ValueError):
+    """Raised when a client sends a cursor we did not issue."""
+
+
+def encode_cursor(state):
+    """Opaque, URL-safe cursor for a dict of per-list positions, or None once every list is done."""
+    if all(value is None for value in state.values()):
+        return None
+    raw = json.dumps(state, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Per-list positions of a cursor from encode_cursor. Raises InvalidCursor for anything else."""
+    if not cursor:
+        return {}
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        state = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, UnicodeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {str(e)}")
+    if not isinstance(state, dict):
+        raise InvalidCursor("Invalid cursor")
+    # The likers offset and the comments max_id go to upstream as is, so a forged value stops here
+    likers = state.get('likers')
+    if likers is not None and (type(likers) is not int or likers < 0):
+        raise InvalidCursor("Invalid cursor: likers must be a non-negative integer")
+    comments = state.get('comments')
+    if comments is not None and not isinstance(comments, str):
+        raise InvalidCursor("Invalid cursor: comments must be a string")
+    return state
+
+
+def parse_limit(value):
+    """Page size from a ?limit= value, clamped to MAX_PAGE_SIZE. None when not paginating."""
+    if value is None:
+        return None
+    limit = int(value)
+    if limit < 1:
+        raise ValueError("limit must be a positive integer")
+    return min(limit, MAX_PAGE_SIZE)
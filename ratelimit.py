@@ -0,0 +1,222 @@
+import os
+import math
+import time
+import logging
+import threading
+
+import requests
+from dotenv import load_dotenv
+from instagrapi.exceptions import (
+    ClientThrottledError,
+    FeedbackRequired,
+    PleaseWaitFewMinutes,
+    RateLimitError,
+)
+
+import metrics
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Exceptions instagrapi raises when Instagram asks us to slow down
+RATE_LIMIT_ERRORS = (ClientThrottledError, FeedbackRequired, PleaseWaitFewMinutes, RateLimitError)
+
+# Default budgets per endpoint class as (requests per second, burst size).
+# Override with e.g. RATE_LIMIT_PROFILE="0.5/10".
+DEFAULT_BUDGETS = {
+    'profile': (0.5, 10),
+    'media': (1.0, 10),
+    'interactions': (0.2, 3),
+    'dm': (0.05, 2),
+    'cdn': (10.0, 20),
+    'default': (0.5, 5),
+}
+
+# Which endpoint class each outbound instagrapi method is charged to
+CLIENT_METHOD_CLASSES = {
+    'user_info_by_username': 'profile',
+    'user_info': 'profile',
+    'user_medias': 'media',
+    'media_info': 'media',
+    'media_likers': 'interactions',
+    'media_comments': 'interactions',
+    'media_comments_chunk': 'interactions',
+    'direct_send': 'dm',
+    'account_info': 'profile',
+}
+
+RATE_LIMIT_MAX_WAIT = float(os.getenv('RATE_LIMIT_MAX_WAIT', '30'))
+BACKOFF_BASE = float(os.getenv('RATE_LIMIT_BACKOFF_BASE', '5'))
+BACKOFF_MAX = float(os.getenv('RATE_LIMIT_BACKOFF_MAX', '600'))
+
+
+class RateBudgetExceeded(Exception):
+    """Raised when a call would have to wait longer than RATE_LIMIT_MAX_WAIT for budget."""
+
+
+def _parse_budget(value, default):
+    # A rate of 0 switches the class off once its burst is spent
+    try:
+        rate, burst = value.split('/')
+        rate, burst = float(rate), int(burst)
+    except (AttributeError, ValueError):
+        return default
+    if not rate >= 0 or burst < 0:
+        logger.warning(f"Ignoring rate budget {value!r}: rate and burst can't be negative; using {default[0]}/{default[1]}")
+        return default
+    return rate, burst
+
+
+class TokenBucket:
+    """Token bucket with burst capacity and an adaptive backoff window."""
+
+    def __init__(self, name, rate, burst):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.backoff = 0.0
+        self.backoff_until = 0.0
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.throttled = 0
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, max_wait=RATE_LIMIT_MAX_WAIT):
+        """Takes one token without sleeping. Returns the seconds to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            # Reserve the token up front so concurrent callers queue behind each other
+            self.tokens -= 1
+            if self.rate > 0:
+                refill_wait = -self.tokens / self.rate
+            else:
+                # No refill: the burst is all there is
+                refill_wait = math.inf if self.tokens < 0 else 0.0
+            delay = max(0.0, refill_wait, self.backoff_until - now)
+            if delay > max_wait:
+                self.tokens += 1
+                if math.isinf(delay):
+                    raise RateBudgetExceeded(f"{self.name} budget exhausted and it does not refill")
+                raise RateBudgetExceeded(f"{self.name} budget exhausted, next slot in {delay:.1f}s")
+            self.calls += 1
+            if delay > 0:
+                self.waits += 1
+                self.wait_seconds += delay
+        return delay
+
+    def acquire(self, max_wait=RATE_LIMIT_MAX_WAIT):
+        """Takes one token, sleeping until it is available. Returns the seconds waited."""
+        delay = self.reserve(max_wait)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def penalize(self):
+        """Widens the backoff window after Instagram pushed back."""
+        with self._lock:
+            now = time.monotonic()
+            self.backoff = min(BACKOFF_MAX, max(BACKOFF_BASE, self.backoff * 2))
+            self.backoff_until = now + self.backoff
+            self.tokens = min(self.tokens, 0.0)
+            self.updated = now
+            self.throttled += 1
+        logger.warning(f"Rate limited on {self.name}, backing off for {self.backoff:.0f}s")
+
+    def relax(self):
+        """Shrinks the backoff window after a successful call."""
+        if not self.backoff:
+            return
+        with self._lock:
+            self.backoff = self.backoff / 2 if self.backoff / 2 >= BACKOFF_BASE else 0.0
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            return {
+                'rate': self.rate,
+                'burst': self.burst,
+                'tokens': round(self.tokens, 2),
+                'calls': self.calls,
+                'waits': self.waits,
+                'wait_seconds': round(self.wait_seconds, 3),
+                'throttled': self.throttled,
+                'backoff_seconds': round(max(0.0, self.backoff_until - now), 1),
+            }
+
+
+class RateGovernor:
+    """Central pacing for every outbound call, with one budget per endpoint class."""
+
+    def __init__(self, budgets=None):
+        budgets = budgets or DEFAULT_BUDGETS
+        self.buckets = {
+            name: TokenBucket(name, *_parse_budget(os.getenv(f"RATE_LIMIT_{name.upper()}"), default))
+            for name, default in budgets.items()
+        }
+
+    def bucket(self, endpoint_class):
+        return self.buckets.get(endpoint_class) or self.buckets['default']
+
+    def call(self, endpoint_class, fn, *args, **kwargs):
+        bucket = self.bucket(endpoint_class)
+        bucket.acquire()
+        try:
+            result = fn(*args, **kwargs)
+        except RATE_LIMIT_ERRORS:
+            bucket.penalize()
+            raise
+        bucket.relax()
+        return result
+
+    def http_get(self, url, session=None, **kwargs):
+        """requests.get charged to the cdn budget, backing off on HTTP 429."""
+        bucket = self.bucket('cdn')
+        bucket.acquire()
+        response = metrics.observe_upstream('cdn_get', (session or requests).get, url, **kwargs)
+        if response.status_code == 429:
+            bucket.penalize()
+        else:
+            bucket.relax()
+        return response
+
+    def stats(self):
+        return {name: bucket.stats() for name, bucket in self.buckets.items()}
+
+
+class GovernedClient:
+    """Wraps an instagrapi Client so its network calls are paced by the governor.
+
+    Methods that are not listed in CLIENT_METHOD_CLASSES (settings, local URL
+    parsing, ...) are passed straight through.
+    """
+
+    def __init__(self, client, rate_governor):
+        self._client = client
+        self._governor = rate_governor
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        endpoint_class = CLIENT_METHOD_CLASSES.get(name)
+        if endpoint_class is None or not callable(attr):
+            return attr
+
+        def governed_call(*args, **kwargs):
+            return self._governor.call(endpoint_class, metrics.observe_upstream, name, attr, *args, **kwargs)
+        return governed_call
+
+
+# Budgets for calls made outside a pooled session, i.e. the CDN. Instagram API calls are
+# paced by the governor of the session that makes them (see sessionpool.PooledSession).
+governor = RateGovernor()
@@ -0,0 +1,168 @@
+import os
+import json
+import gzip
+import uuid
+import hashlib
+import logging
+from datetime import date, datetime
+
+from dotenv import load_dotenv
+from flask import current_app, has_request_context, request
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the stdlib encoder is slower, see encode for how their output differs
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; without it only gzip is offered
+    brotli = None
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Compression configuration, overridable from the environment
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', '1024'))
+COMPRESS_LEVEL = int(os.getenv('COMPRESS_LEVEL', '6'))
+BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', '5'))
+COMPRESSIBLE_MIMETYPES = ('application/json', 'text/plain', 'text/html')
+
+if orjson is not None:
+    ORJSON_OPTIONS = (
+        orjson.OPT_SORT_KEYS
+        | orjson.OPT_NON_STR_KEYS
+        | orjson.OPT_SERIALIZE_NUMPY
+        | orjson.OPT_PASSTHROUGH_DATETIME
+    )
+
+
+def _default(o):
+    # Same conversions as Flask's JSONEncoder, so both encoders serialize these types alike
+    if isinstance(o, datetime):
+        return http_date(o.utctimetuple())
+    if isinstance(o, date):
+        return http_date(o.timetuple())
+    if isinstance(o, uuid.UUID):
+        return str(o)
+    if hasattr(o, 'item') and callable(o.item):
+        # NumPy scalars
+        return o.item()
+    if hasattr(o, '__html__'):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+def encode(obj):
+    """Compact, key-sorted UTF-8 JSON as bytes, through orjson when it is installed.
+
+    Both encoders write non-ASCII text as UTF-8 rather than \\u escapes. They still
+    differ on floats: orjson writes NaN and infinities as null, the stdlib as NaN and
+    Infinity, and a few values may get a different but equivalent float spelling.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS)
+    return json.dumps(obj, default=_default, separators=(',', ':'), sort_keys=True, ensure_ascii=False).encode('utf-8')
+
+
+def dumps(obj):
+    """encode() as a str, for NDJSON lines and stored job results."""
+    return encode(obj).decode('utf-8')
+
+
+def jsonify(*args, **kwargs):
+    """Drop-in for flask.jsonify that goes through encode()."""
+    if args and kwargs:
+        raise TypeError('jsonify() behavior undefined when passed both args and kwargs')
+    data = args[0] if len(args) == 1 else args or kwargs
+    return current_app.response_class(encode(data) + b'\n', mimetype=current_app.config['JSONIFY_MIMETYPE'])
+
+
+# Field projection via ?fields=a,b,c
+def requested_fields():
+    """The set of fields asked for with ?fields=, or None when every field is wanted."""
+    return parse_fields(request.args.get('fields') if has_request_context() else None)
+
+
+def parse_fields(raw):
+    """The projection named by a raw ?fields= value."""
+    if not raw:
+        return None
+    return frozenset(field.strip() for field in raw.split(',') if field.strip()) or None
+
+
+def wants(fields, *names):
+    """True if any of names is part of the projection, so the work behind it is needed."""
+    return fields is None or any(name in fields for name in names)
+
+
+def project(data, fields, always=()):
+    """Keeps only the projected keys of data, plus the always keys."""
+    if fields is None:
+        return data
+    return {key: value for key, value in data.items() if key in fields or key in always}
+
+
+# Compression and conditional GET
+# These take plain values rather than the Flask request, so they can be used outside a request
+def negotiate_encoding(accept, size):
+    """The content coding to send a body of size bytes with, given the parsed Accept-Encoding."""
+    if size < COMPRESS_MIN_BYTES:
+        return None
+    offers = (['br'] if brotli is not None else []) + ['gzip']
+    best = max(offers, key=lambda encoding: accept[encoding])
+    return best if accept[best] > 0 else None
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, COMPRESS_LEVEL, mtime=0)
+
+
+def body_etag(body, encoding):
+    digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+    return f"{digest}-{encoding}" if encoding else digest
+
+
+def finalize_response(response):
+    """Adds a strong ETag, answers If-None-Match with 304 and compresses what is left.
+
+    The ETag is a digest of the uncompressed body plus the chosen content
+    coding, so it changes exactly when the entities behind the response do,
+    and a 304 skips both the compression and the transfer.
+    """
+    if response.direct_passthrough or response.is_streamed:
+        return response
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES or 'Content-Encoding' in response.headers:
+        return response
+
+    body = response.get_data()
+    encoding = negotiate_encoding(request.accept_encodings, len(body))
+    response.vary.add('Accept-Encoding')
+
+    if request.method in ('GET', 'HEAD') and response.status_code == 200 and 'ETag' not in response.headers:
+        etag = body_etag(body, encoding)
+        response.set_etag(etag)
+        if 'Cache-Control' not in response.headers:
+            # Cacheable, but always revalidated, which is a cheap 304 while nothing changed
+            response.cache_control.no_cache = True
+        if request.if_none_match.contains_weak(etag):
+            response.status_code = 304
+            response.set_data(b'')
+            response.headers.pop('Content-Length', None)
+            return response
+
+    if encoding is not None:
+        response.set_data(compress(body, encoding))
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def install(app):
+    """Runs finalize_response on every response of app."""
+    app.after_request(finalize_response)
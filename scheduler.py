@@ -0,0 +1,177 @@
+import os
+import math
+import time
+import heapq
+import logging
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+from sqlalchemy import text
+
+from models import db, Influencer
+from ratelimit import TokenBucket
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Scheduler configuration, overridable from the environment
+SCHEDULER_ENABLED = os.getenv('SCHEDULER_ENABLED', '0') == '1'
+SCHEDULER_WORKERS = int(os.getenv('SCHEDULER_WORKERS', '2'))
+SCHEDULER_CALLS_PER_HOUR = int(os.getenv('SCHEDULER_CALLS_PER_HOUR', '300'))
+# Rows refreshed more recently than this are left alone
+SCHEDULER_MIN_AGE = int(os.getenv('SCHEDULER_MIN_AGE', '3600'))
+SCHEDULER_BATCH_SIZE = int(os.getenv('SCHEDULER_BATCH_SIZE', '50'))
+SCHEDULER_IDLE_INTERVAL = float(os.getenv('SCHEDULER_IDLE_INTERVAL', '60'))
+SCHEDULER_ELECTION_INTERVAL = float(os.getenv('SCHEDULER_ELECTION_INTERVAL', '30'))
+# Arbitrary but fixed key shared by every worker competing for leadership
+SCHEDULER_LOCK_KEY = int(os.getenv('SCHEDULER_LOCK_KEY', '724317'))
+
+
+def refresh_priority(influencer, now):
+    """Staleness in seconds, weighted up for bigger accounts."""
+    updated_at = influencer.updated_at or datetime.min
+    staleness = (now - updated_at).total_seconds()
+    return staleness * (1 + math.log10(1 + max(influencer.followers or 0, 0)))
+
+
+class RefreshScheduler:
+    """Keeps tracked influencers fresh in the background, stalest and biggest first.
+
+    Every gunicorn worker runs one of these, but only the worker holding the
+    Postgres advisory lock schedules refreshes; the others wait to take over
+    if the leader goes away. Upstream calls made by the scheduler are capped
+    by SCHEDULER_CALLS_PER_HOUR on top of the per-session rate budgets.
+    """
+
+    def __init__(self, refresh_fn, workers=SCHEDULER_WORKERS, calls_per_hour=SCHEDULER_CALLS_PER_HOUR):
+        self.refresh_fn = refresh_fn
+        self.workers = workers
+        self.budget = TokenBucket('scheduler', calls_per_hour / 3600.0, max(1, workers))
+        self._app = None
+        self._thread = None
+        self._lock_conn = None
+        self.is_leader = False
+        self._slots = threading.Semaphore(workers)
+        self._executor = None
+        # Usernames refreshed by this leader whose new updated_at may not be flushed yet
+        self._recent = {}
+        self.refreshed = 0
+        self.failed = 0
+        self.cycles = 0
+
+    def _elect(self):
+        """Tries to take, or confirms we still hold, the scheduling lock."""
+        if db.engine.dialect.name != 'postgresql':
+            # Without Postgres there is no shared lock; assume a single-process setup
+            self.is_leader = True
+            return True
+
+        if self._lock_conn is not None:
+            try:
+                self._lock_conn.execute(text('SELECT 1'))
+                return True
+            except Exception as e:
+                logger.warning(f"Lost scheduler lock connection: {str(e)}")
+                self._release_lock()
+
+        conn = db.engine.connect()
+        try:
+            acquired = conn.execute(text('SELECT pg_try_advisory_lock(:key)'), key=SCHEDULER_LOCK_KEY).scalar()
+        except Exception:
+            conn.close()
+            raise
+        if not acquired:
+            conn.close()
+            return False
+        # The session-level lock lives as long as this connection stays open
+        self._lock_conn = conn
+        self.is_leader = True
+        logger.info("This worker is now the refresh scheduler leader.")
+        return True
+
+    def _release_lock(self):
+        conn, self._lock_conn = self._lock_conn, None
+        self.is_leader = False
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def _stale_candidates(self):
+        now = datetime.utcnow()
+        cutoff = now - timedelta(seconds=SCHEDULER_MIN_AGE)
+        rows = (
+            Influencer.query.filter(Influencer.updated_at < cutoff)
+            .order_by(Influencer.updated_at)
+            .limit(SCHEDULER_BATCH_SIZE * 4)
+            .all()
+        )
+        self._recent = {username: ts for username, ts in self._recent.items() if ts > cutoff}
+        heap = [(-refresh_priority(row, now), row.username) for row in rows if row.username not in self._recent]
+        heapq.heapify(heap)
+        return heap
+
+    def _refresh(self, username):
+        try:
+            self.refresh_fn(username)
+            self.refreshed += 1
+        except Exception as e:
+            self.failed += 1
+            logger.warning(f"Scheduled refresh of {username} failed: {str(e)}")
+        finally:
+            self._slots.release()
+
+    def run_cycle(self):
+        """Refreshes up to SCHEDULER_BATCH_SIZE of the highest priority stale influencers."""
+        with self._app.app_context():
+            heap = self._stale_candidates()
+        self.cycles += 1
+        submitted = 0
+        while heap and submitted < SCHEDULER_BATCH_SIZE:
+            _, username = heapq.heappop(heap)
+            self._recent[username] = datetime.utcnow()
+            # Sleeps until the hourly budget has room; other workers are unaffected
+            self.budget.acquire(max_wait=3600)
+            self._slots.acquire()
+            self._executor.submit(self._refresh, username)
+            submitted += 1
+        return submitted
+
+    def _run(self):
+        while True:
+            try:
+                with self._app.app_context():
+                    leader = self._elect()
+                if not leader:
+                    time.sleep(SCHEDULER_ELECTION_INTERVAL)
+                    continue
+                if not self.run_cycle():
+                    time.sleep(SCHEDULER_IDLE_INTERVAL)
+            except Exception as e:
+                logger.error(f"Refresh scheduler cycle failed: {str(e)}")
+                time.sleep(SCHEDULER_ELECTION_INTERVAL)
+
+    def start(self, app):
+        if self._thread is not None:
+            return
+        self._app = app
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='refresh')
+        self._thread = threading.Thread(target=self._run, name='refresh-scheduler', daemon=True)
+        self._thread.start()
+
+    def stats(self):
+        return {
+            'enabled': self._thread is not None,
+            'leader': self.is_leader,
+            'workers': self.workers,
+            'cycles': self.cycles,
+            'refreshed': self.refreshed,
+            'failed': self.failed,
+            'budget': self.budget.stats(),
+        }
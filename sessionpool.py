@@ -0,0 +1,257 @@
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+from instagrapi import Client
+from instagrapi.exceptions import ChallengeRequired, LoginRequired
+
+from ratelimit import RateGovernor, GovernedClient, RATE_LIMIT_ERRORS
+from sessionhandle import load_session_from_file, save_session_to_file
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Pool configuration, overridable from the environment
+POOL_CHECKOUT_TIMEOUT = float(os.getenv('SESSION_POOL_CHECKOUT_TIMEOUT', '30'))
+POOL_QUARANTINE_SECONDS = float(os.getenv('SESSION_POOL_QUARANTINE_SECONDS', '900'))
+POOL_REFRESH_INTERVAL = float(os.getenv('SESSION_POOL_REFRESH_INTERVAL', '300'))
+
+# Errors that mean the session itself is unhealthy, not just the request
+QUARANTINE_ERRORS = (ChallengeRequired, LoginRequired) + RATE_LIMIT_ERRORS
+
+
+# Per-budget counters that rate_limit_stats adds up across sessions
+SUMMED_BUDGET_STATS = ('rate', 'burst', 'tokens', 'calls', 'waits', 'wait_seconds', 'throttled')
+
+
+class PoolExhausted(Exception):
+    """Raised when no healthy session frees up within the checkout timeout."""
+
+
+class PooledSession:
+    """One Instagram session with its own client and its own rate budget."""
+
+    def __init__(self, name, settings, source_file=None):
+        self.name = name
+        self.settings = settings
+        self.source_file = source_file
+        self.governor = RateGovernor()
+        self.client = GovernedClient(Client(), self.governor)
+        self.in_use = False
+        self.last_used = 0.0
+        self.quarantined_until = 0.0
+        self.calls = 0
+        self.errors = 0
+        self.quarantines = 0
+        self.load()
+
+    def load(self):
+        self.client.set_settings(self.settings)
+        if not self.client.user_id:
+            logger.error(f"Invalid session {self.name}. Please run sessionhandle.py to regenerate the session.")
+            self.quarantine()
+
+    def quarantine(self, seconds=POOL_QUARANTINE_SECONDS):
+        self.quarantined_until = time.monotonic() + seconds
+        self.quarantines += 1
+
+    def is_quarantined(self):
+        # A quarantine only ends when the refresher has re-validated the session, never by itself
+        return self.quarantined_until > 0
+
+    def recheck_due(self, now=None):
+        """True once a quarantined session has sat out its quarantine and may be health-checked."""
+        return self.is_quarantined() and self.quarantined_until <= (now or time.monotonic())
+
+    def stats(self):
+        now = time.monotonic()
+        return {
+            'in_use': self.in_use,
+            'quarantined': self.is_quarantined(),
+            'quarantine_remaining': round(max(0.0, self.quarantined_until - now), 1),
+            'calls': self.calls,
+            'errors': self.errors,
+            'error_rate': round(self.errors / self.calls, 4) if self.calls else 0.0,
+            'quarantines': self.quarantines,
+            'rate_limits': self.governor.stats(),
+        }
+
+
+class SessionPool:
+    """Hands out Instagram sessions one request at a time.
+
+    instagrapi clients are not thread-safe, so each checkout gets exclusive use
+    of one session. The least recently used healthy session is picked, and a
+    session that hits a challenge or rate limit is quarantined until the
+    background refresher finds it healthy again.
+
+    Exclusive checkout means the pool size is also the number of upstream
+    calls in flight: with a single session every call is serialized, so
+    configure several sessions for any concurrent load.
+    """
+
+    def __init__(self, sessions):
+        self.sessions = sessions
+        self._cond = threading.Condition()
+        self.checkouts = 0
+        self.checkout_wait_seconds = 0.0
+        self.timeouts = 0
+        self._refresher = None
+
+    def _pick(self):
+        idle = [s for s in self.sessions if not s.in_use and not s.is_quarantined()]
+        return min(idle, key=lambda s: s.last_used) if idle else None
+
+    def acquire(self, timeout=POOL_CHECKOUT_TIMEOUT):
+        started = time.monotonic()
+        deadline = started + timeout
+        with self._cond:
+            session = self._pick()
+            while session is None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolExhausted(f"No Instagram session available after {timeout}s")
+                # release() and refresh() notify, the timeout only bounds a missed wake-up
+                self._cond.wait(min(remaining, 1.0))
+                session = self._pick()
+            session.in_use = True
+            self.checkouts += 1
+            self.checkout_wait_seconds += time.monotonic() - started
+        return session
+
+    def release(self, session, error=None):
+        with self._cond:
+            session.in_use = False
+            session.last_used = time.monotonic()
+            session.calls += 1
+            if error is not None:
+                session.errors += 1
+                if isinstance(error, QUARANTINE_ERRORS):
+                    logger.warning(f"Quarantining session {session.name}: {type(error).__name__}")
+                    session.quarantine()
+            self._cond.notify()
+
+    @contextmanager
+    def checkout(self, timeout=POOL_CHECKOUT_TIMEOUT):
+        """Yields a rate-governed client for exclusive use by the caller."""
+        session = self.acquire(timeout)
+        try:
+            yield session.client
+        except Exception as e:
+            self.release(session, e)
+            raise
+        else:
+            self.release(session)
+
+    def refresh(self):
+        """Re-validates quarantined sessions and persists rotated cookies of healthy ones."""
+        for session in self.sessions:
+            with self._cond:
+                if session.in_use:
+                    continue
+                due = session.recheck_due()
+                session.in_use = True
+            try:
+                if due:
+                    # Pick up a regenerated session file if there is one
+                    if session.source_file:
+                        session.settings = load_session_from_file(session.source_file) or session.settings
+                    session.load()
+                    if session.client.user_id:
+                        # Charged to the session's own profile budget, so a throttled session isn't poked early
+                        session.client.account_info()
+                        with self._cond:
+                            session.quarantined_until = 0.0
+                        logger.info(f"Session {session.name} is healthy again.")
+                elif session.source_file and not session.is_quarantined():
+                    save_session_to_file(session.client.get_settings(), session.source_file)
+            except Exception as e:
+                logger.warning(f"Session {session.name} failed its health check: {str(e)}")
+                session.quarantine()
+            finally:
+                with self._cond:
+                    session.in_use = False
+                    self._cond.notify()
+
+    def start_refresher(self, interval=POOL_REFRESH_INTERVAL):
+        if self._refresher is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logger.error(f"Session refresh failed: {str(e)}")
+
+        self._refresher = threading.Thread(target=run, name='session-refresher', daemon=True)
+        self._refresher.start()
+
+    def rate_limit_stats(self):
+        """Rate budgets summed over the pool. Each session has its own budgets, so capacity adds up."""
+        totals = {}
+        for session in self.sessions:
+            for name, bucket in session.governor.stats().items():
+                total = totals.setdefault(name, {key: 0 for key in SUMMED_BUDGET_STATS})
+                for key in SUMMED_BUDGET_STATS:
+                    total[key] += bucket[key]
+                total['backoff_seconds'] = max(total.get('backoff_seconds', 0.0), bucket['backoff_seconds'])
+        for total in totals.values():
+            total['tokens'] = round(total['tokens'], 2)
+            total['wait_seconds'] = round(total['wait_seconds'], 3)
+        return totals
+
+    def stats(self):
+        with self._cond:
+            return {
+                'size': len(self.sessions),
+                'available': sum(1 for s in self.sessions if not s.in_use and not s.is_quarantined()),
+                'in_use': sum(1 for s in self.sessions if s.in_use),
+                'quarantined': sum(1 for s in self.sessions if s.is_quarantined()),
+                'checkouts': self.checkouts,
+                'checkout_timeouts': self.timeouts,
+                'avg_checkout_wait': round(self.checkout_wait_seconds / self.checkouts, 4) if self.checkouts else 0.0,
+                'sessions': {s.name: s.stats() for s in self.sessions},
+            }
+
+
+def load_pool_from_env():
+    """Builds the pool from every session configured in the environment.
+
+    INSTAGRAM_SESSION_JSON holds one session blob, INSTAGRAM_SESSION_JSONS a
+    JSON list of blobs and INSTAGRAM_SESSION_FILES a comma separated list of
+    session files as written by sessionhandle.py.
+    """
+    sessions = []
+
+    single = os.getenv('INSTAGRAM_SESSION_JSON')
+    if single:
+        sessions.append(PooledSession('session-0', json.loads(single)))
+
+    for blob in json.loads(os.getenv('INSTAGRAM_SESSION_JSONS') or '[]'):
+        sessions.append(PooledSession(f"session-{len(sessions)}", blob))
+
+    for path in filter(None, (p.strip() for p in os.getenv('INSTAGRAM_SESSION_FILES', '').split(','))):
+        settings = load_session_from_file(path)
+        if settings is None:
+            logger.error(f"Skipping unreadable session file {path}")
+            continue
+        sessions.append(PooledSession(os.path.basename(path), settings, source_file=path))
+
+    if not sessions:
+        logger.error("Instagram session JSON is not set in environment variables.")
+        raise ValueError("Instagram session JSON is not set in environment variables.")
+
+    logger.info(f"Loaded {len(sessions)} Instagram session(s) into the pool.")
+    if len(sessions) == 1:
+        logger.warning("Only one Instagram session is configured, so upstream calls are made one at a time.")
+    return SessionPool(sessions)
@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+# The modules live at the repository root rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep the image cache and job database the modules create on import out of the working tree
+os.environ.setdefault('IMAGE_CACHE_DIR', tempfile.mkdtemp(prefix='image-cache-'))
+os.environ.setdefault('JOB_DB_PATH', os.path.join(tempfile.mkdtemp(prefix='jobs-'), 'jobs.sqlite3'))
@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from engagement import compute_stats
+
+
+def make_medias(likes, comments=None, media_type=1, start=datetime(2024, 1, 1), gap=timedelta(days=1)):
+    comments = comments or [0] * len(likes)
+    return [
+        SimpleNamespace(like_count=like, comment_count=comment, media_type=media_type,
+                        taken_at=start + gap * index, code=f"code{index}")
+        for index, (like, comment) in enumerate(zip(likes, comments))
+    ]
+
+
+def test_like_percentiles_interpolate_linearly():
+    stats = compute_stats(1000, make_medias([10, 20, 30, 40, 50]))
+    assert stats['posts_analyzed'] == 5
+    assert stats['likes'] == {
+        'mean': 30.0, 'median': 30.0, 'min': 10.0, 'max': 50.0,
+        'p25': 20.0, 'p50': 30.0, 'p75': 40.0, 'p90': 46.0,
+    }
+
+
+def test_engagement_rate_is_a_percentage_of_followers():
+    stats = compute_stats(200, make_medias([10, 30], comments=[10, 10]))
+    # (10 + 10) / 200 and (30 + 10) / 200
+    assert stats['engagement_rate']['min'] == 10.0
+    assert stats['engagement_rate']['max'] == 20.0
+    assert stats['engagement_rate']['p50'] == 15.0
+    assert stats['comment_like_ratio'] == 0.5
+
+
+def test_no_followers_gives_zero_engagement():
+    stats = compute_stats(0, make_medias([10, 20]))
+    assert stats['engagement_rate']['max'] == 0.0
+
+
+def test_empty_window():
+    stats = compute_stats(100, [])
+    assert stats['posts_analyzed'] == 0
+    assert stats['likes']['p90'] == 0
+    assert stats['comment_like_ratio'] is None
+    assert stats['cadence']['posts_per_week'] is None
+
+
+def test_cadence_from_posting_gaps():
+    stats = compute_stats(100, make_medias([1] * 8, gap=timedelta(days=2)))
+    assert stats['cadence']['average_gap_days'] == 2.0
+    assert stats['cadence']['median_gap_days'] == 2.0
+    # 8 posts over 14 days
+    assert stats['cadence']['posts_per_week'] == 4.0
+
+
+def test_viral_post_is_an_outlier():
+    stats = compute_stats(1000, make_medias([100, 110, 90, 105, 95, 5000]))
+    assert [outlier['code'] for outlier in stats['outliers']] == ['code5']
+    assert stats['outliers'][0]['post_url'] == 'https://www.instagram.com/p/code5/'
@@ -0,0 +1,52 @@
+import threading
+import time
+
+import pytest
+
+from fanout import fan_out, ItemTimeout
+
+
+def test_yields_every_item_with_its_index():
+    results = {index: result for index, item, result, error in fan_out(lambda x: x * 2, [1, 2, 3], max_workers=2)}
+    assert results == {0: 2, 1: 4, 2: 6}
+
+
+def test_empty_items_yields_nothing():
+    assert list(fan_out(lambda x: x, [])) == []
+
+
+def test_one_failing_item_does_not_fail_the_rest():
+    def func(item):
+        if item == 'bad':
+            raise ValueError('boom')
+        return item.upper()
+
+    outcomes = {item: (result, error) for index, item, result, error in fan_out(func, ['a', 'bad', 'c'])}
+    assert outcomes['a'] == ('A', None)
+    assert outcomes['c'] == ('C', None)
+    assert outcomes['bad'][0] is None
+    assert isinstance(outcomes['bad'][1], ValueError)
+
+
+def test_slow_item_times_out_without_holding_up_the_batch():
+    release = threading.Event()
+
+    def func(item):
+        if item == 'slow':
+            release.wait(5)
+        return item
+
+    start = time.monotonic()
+    try:
+        outcomes = {item: (result, error) for index, item, result, error in fan_out(func, ['fast', 'slow'], timeout=0.3)}
+    finally:
+        release.set()
+    assert time.monotonic() - start < 2
+    assert outcomes['fast'] == ('fast', None)
+    assert isinstance(outcomes['slow'][1], ItemTimeout)
+
+
+@pytest.mark.parametrize('max_workers', [0, -3])
+def test_non_positive_max_workers_still_runs(max_workers):
+    results = [result for index, item, result, error in fan_out(lambda x: x, [1, 2], max_workers=max_workers)]
+    assert sorted(results) == [1, 2]
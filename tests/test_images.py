@@ -0,0 +1,46 @@
+import socket
+
+import pytest
+import requests
+
+import images
+
+
+def closed_port():
+    """A local port nothing listens on, so connecting to it is refused."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.mark.parametrize('mode, expected', [
+    ('base64', {'profile_pic_base64': None}),
+    ('url', {'profile_pic_hash': None, 'profile_pic_cached_url': None}),
+])
+def test_unreachable_picture_gives_null_fields(mode, expected):
+    url = f"http://127.0.0.1:{closed_port()}/pic/missing.jpg"
+    assert images.profile_pic_fields(url, mode) == expected
+
+
+@pytest.mark.parametrize('error', [
+    requests.HTTPError('403 Client Error: Forbidden'),
+    requests.Timeout('read timed out'),
+    OSError('disk full'),
+])
+def test_failed_fetch_gives_null_fields(monkeypatch, error):
+    def fetch_image(url):
+        raise error
+
+    monkeypatch.setattr(images, 'fetch_image', fetch_image)
+    assert images.profile_pic_fields('https://cdn.example/pic.jpg', 'url') == {
+        'profile_pic_hash': None, 'profile_pic_cached_url': None,
+    }
+
+
+def test_unexpected_errors_still_propagate(monkeypatch):
+    def fetch_image(url):
+        raise KeyError('bug')
+
+    monkeypatch.setattr(images, 'fetch_image', fetch_image)
+    with pytest.raises(KeyError):
+        images.profile_pic_fields('https://cdn.example/pic.jpg')
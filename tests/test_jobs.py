@@ -0,0 +1,56 @@
+import time
+
+import pytest
+
+from jobs import JobQueue, QUEUED, RUNNING, FAILED, JOB_LEASE_SECONDS
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(str(tmp_path / 'jobs.sqlite3'))
+    queue.register('noop', lambda context, username: username)
+    return queue
+
+
+def orphan(queue, job_id, attempts):
+    """Leaves job_id as a dead worker would: running, with an expired lease."""
+    queue._update(job_id, status=RUNNING, attempts=attempts)
+    with queue._connect() as conn:
+        conn.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (time.time() - JOB_LEASE_SECONDS - 1, job_id))
+
+
+def test_expired_lease_is_requeued_while_attempts_remain(queue):
+    job_id = queue.submit('noop', {'username': 'bob'}, max_attempts=3)
+    orphan(queue, job_id, attempts=1)
+
+    row = queue._claim()
+    assert row['id'] == job_id
+    assert queue.get(job_id)['status'] == RUNNING
+    assert queue.get(job_id)['attempts'] == 2
+
+
+def test_expired_lease_on_the_last_attempt_fails_the_job(queue):
+    job_id = queue.submit('noop', {'username': 'bob'}, max_attempts=2)
+    orphan(queue, job_id, attempts=2)
+
+    assert queue._claim() is None
+    job = queue.get(job_id)
+    assert job['status'] == FAILED
+    assert 'Lease expired' in job['error']
+    assert job['expires_at'] is not None
+
+
+def test_live_lease_is_left_running(queue):
+    job_id = queue.submit('noop', {'username': 'bob'})
+    queue._update(job_id, status=RUNNING, attempts=1)
+
+    assert queue._claim() is None
+    assert queue.get(job_id)['status'] == RUNNING
+
+
+def test_submit_checks_params(queue):
+    with pytest.raises(ValueError):
+        queue.submit('noop', {})
+    with pytest.raises(ValueError):
+        queue.submit('noop', {'username': 'bob', 'extra': 1})
+    assert queue.get(queue.submit('noop', {'username': 'bob'}))['status'] == QUEUED
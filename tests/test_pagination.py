@@ -0,0 +1,64 @@
+import pytest
+
+from pagination import encode_cursor, decode_cursor, parse_limit, InvalidCursor, MAX_PAGE_SIZE
+
+
+@pytest.mark.parametrize('state', [
+    {'likers': 100, 'comments': 'QVFEbWF4X2lkPTE3OTk='},
+    {'likers': None, 'comments': 'next'},
+    {'likers': 0},
+])
+def test_cursor_round_trips(state):
+    cursor = encode_cursor(state)
+    assert decode_cursor(cursor) == state
+
+
+def test_cursor_is_url_safe_without_padding():
+    cursor = encode_cursor({'comments': '??>>' * 10, 'likers': 12345})
+    assert '=' not in cursor
+    assert '+' not in cursor and '/' not in cursor
+
+
+def test_no_cursor_once_every_list_is_done():
+    assert encode_cursor({'likers': None, 'comments': None}) is None
+
+
+@pytest.mark.parametrize('cursor', [None, ''])
+def test_missing_cursor_starts_from_the_beginning(cursor):
+    assert decode_cursor(cursor) == {}
+
+
+@pytest.mark.parametrize('cursor', ['not a cursor!', 'bm90IGpzb24', 'WzEsMl0'])
+def test_foreign_cursor_is_rejected(cursor):
+    # Invalid base64, base64 of "not json", and a JSON list rather than an object
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor)
+
+
+@pytest.mark.parametrize('state', [
+    {'likers': 'x'},
+    {'likers': -1},
+    {'likers': 1.5},
+    {'likers': True},
+    {'likers': [1]},
+    {'comments': 5},
+    {'comments': {'max_id': 'a'}},
+])
+def test_forged_positions_are_rejected(state):
+    # Well-formed cursors, but not positions we would have issued
+    cursor = encode_cursor(state)
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor)
+
+
+def test_invalid_cursor_is_a_value_error():
+    # The views turn ValueError into a 400
+    assert issubclass(InvalidCursor, ValueError)
+
+
+def test_parse_limit():
+    assert parse_limit(None) is None
+    assert parse_limit('5') == 5
+    assert parse_limit(str(MAX_PAGE_SIZE + 1)) == MAX_PAGE_SIZE
+    with pytest.raises(ValueError):
+        parse_limit('0')
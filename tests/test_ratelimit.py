@@ -0,0 +1,98 @@
+import types
+
+import pytest
+
+import ratelimit
+from ratelimit import TokenBucket, RateBudgetExceeded, BACKOFF_BASE, _parse_budget
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A manual monotonic clock for the buckets under test."""
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit, 'time', types.SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def test_burst_is_available_immediately(clock):
+    bucket = TokenBucket('test', rate=1.0, burst=3)
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+
+
+def test_reserve_beyond_burst_waits_for_refill(clock):
+    bucket = TokenBucket('test', rate=2.0, burst=1)
+    assert bucket.reserve() == 0.0
+    # Each further token is half a second behind the previous one
+    assert bucket.reserve() == pytest.approx(0.5)
+    assert bucket.reserve() == pytest.approx(1.0)
+    assert bucket.stats()['waits'] == 2
+
+
+def test_tokens_refill_over_time_up_to_burst(clock):
+    bucket = TokenBucket('test', rate=1.0, burst=2)
+    bucket.reserve()
+    bucket.reserve()
+    clock[0] += 1.5
+    assert bucket.stats()['tokens'] == 1.5
+    clock[0] += 100
+    assert bucket.stats()['tokens'] == 2
+
+
+def test_reserve_over_max_wait_raises_and_returns_the_token(clock):
+    bucket = TokenBucket('test', rate=0.1, burst=1)
+    bucket.reserve()
+    with pytest.raises(RateBudgetExceeded):
+        bucket.reserve(max_wait=5)
+    assert bucket.stats()['tokens'] == 0
+    assert bucket.stats()['calls'] == 1
+
+
+def test_penalize_opens_a_backoff_window(clock):
+    bucket = TokenBucket('test', rate=10.0, burst=10)
+    bucket.penalize()
+    assert bucket.stats()['throttled'] == 1
+    assert bucket.stats()['backoff_seconds'] == BACKOFF_BASE
+    # The burst is gone and the next call waits out the window
+    assert bucket.reserve(max_wait=BACKOFF_BASE + 1) == pytest.approx(BACKOFF_BASE)
+    clock[0] += BACKOFF_BASE
+    assert bucket.stats()['backoff_seconds'] == 0
+
+
+def test_repeated_penalties_double_the_window_and_relax_halves_it(clock):
+    bucket = TokenBucket('test', rate=1.0, burst=1)
+    bucket.penalize()
+    bucket.penalize()
+    assert bucket.backoff == BACKOFF_BASE * 2
+    bucket.relax()
+    assert bucket.backoff == BACKOFF_BASE
+    bucket.relax()
+    assert bucket.backoff == 0.0
+
+
+def test_zero_rate_allows_only_the_burst(clock):
+    bucket = TokenBucket('dm', rate=0, burst=1)
+    assert bucket.reserve() == 0.0
+    with pytest.raises(RateBudgetExceeded):
+        bucket.reserve()
+    clock[0] += 3600
+    with pytest.raises(RateBudgetExceeded):
+        bucket.reserve()
+    assert bucket.stats()['tokens'] == 0
+
+
+def test_zero_rate_and_burst_allows_nothing(clock):
+    with pytest.raises(RateBudgetExceeded):
+        TokenBucket('dm', rate=0, burst=0).reserve()
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('2/10', (2.0, 10)),
+    ('0/2', (0.0, 2)),
+    ('-1/2', (0.5, 5)),
+    ('1/-2', (0.5, 5)),
+    ('nan/2', (0.5, 5)),
+    ('fast', (0.5, 5)),
+    (None, (0.5, 5)),
+])
+def test_parse_budget(value, expected):
+    assert _parse_budget(value, (0.5, 5)) == expected
@@ -0,0 +1,83 @@
+import gzip
+
+import pytest
+from flask import Flask
+from werkzeug.http import parse_accept_header
+
+import responses
+from responses import negotiate_encoding, body_etag, compress, encode, COMPRESS_MIN_BYTES
+
+LARGE = COMPRESS_MIN_BYTES + 1
+
+
+def accept(value):
+    return parse_accept_header(value)
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('gzip', 'gzip'),
+    ('gzip, br', 'br'),
+    ('br;q=0.5, gzip', 'gzip'),
+    ('identity', None),
+    ('*', 'br'),
+    ('gzip;q=0', None),
+    (None, None),
+])
+def test_negotiate_encoding(monkeypatch, header, expected):
+    monkeypatch.setattr(responses, 'brotli', object())
+    assert negotiate_encoding(accept(header), LARGE) == expected
+
+
+def test_negotiate_encoding_without_brotli(monkeypatch):
+    monkeypatch.setattr(responses, 'brotli', None)
+    assert negotiate_encoding(accept('gzip, br'), LARGE) == 'gzip'
+    assert negotiate_encoding(accept('br'), LARGE) is None
+
+
+def test_small_bodies_are_not_compressed():
+    assert negotiate_encoding(accept('gzip'), COMPRESS_MIN_BYTES - 1) is None
+
+
+def test_body_etag_depends_on_body_and_encoding():
+    etag = body_etag(b'{"a":1}', None)
+    assert etag == body_etag(b'{"a":1}', None)
+    assert etag != body_etag(b'{"a":2}', None)
+    assert body_etag(b'{"a":1}', 'gzip') == f"{etag}-gzip"
+
+
+def test_gzip_output_is_deterministic():
+    body = b'x' * LARGE
+    assert compress(body, 'gzip') == compress(body, 'gzip')
+    assert gzip.decompress(compress(body, 'gzip')) == body
+
+
+def test_stdlib_fallback_matches_orjson_for_non_ascii(monkeypatch):
+    data = {'full_name': 'Zoë 🌸', 'caption': 'café', 'likes': [1, 2]}
+    expected = '{"caption":"café","full_name":"Zoë 🌸","likes":[1,2]}'.encode('utf-8')
+    assert encode(data) == expected
+    monkeypatch.setattr(responses, 'orjson', None)
+    assert encode(data) == expected
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    responses.install(app)
+
+    @app.route('/data')
+    def data():
+        return responses.jsonify({'items': list(range(LARGE))})
+
+    return app.test_client()
+
+
+def test_finalize_response_adds_etag_and_answers_if_none_match(client):
+    response = client.get('/data', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    etag = response.headers['ETag']
+    assert etag.endswith('-gzip"')
+
+    conditional = client.get('/data', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert conditional.status_code == 304
+    assert conditional.get_data() == b''
@@ -0,0 +1,97 @@
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def test_returns_the_result_of_fn():
+    group = SingleFlight()
+    assert group.do('key', lambda: 42) == 42
+    assert group.stats() == {'executed': 1, 'coalesced': 0, 'in_flight': 0}
+
+
+def test_concurrent_calls_for_a_key_share_one_execution():
+    group = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'value'
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(group.do('key', fn)))
+    leader.start()
+    assert started.wait(5)
+
+    followers = [threading.Thread(target=lambda: results.append(group.do('key', fn))) for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    # Let the followers register before the leader finishes
+    wait_until(lambda: group.stats()['coalesced'] == 3)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+
+    assert calls == [1]
+    assert results == ['value'] * 4
+    assert group.stats() == {'executed': 1, 'coalesced': 3, 'in_flight': 0}
+
+
+def test_waiters_receive_the_leaders_exception():
+    group = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def fn():
+        started.set()
+        release.wait(5)
+        raise KeyError('missing')
+
+    errors = []
+
+    def call():
+        try:
+            group.do('key', fn)
+        except KeyError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    assert started.wait(5)
+    follower = threading.Thread(target=call)
+    follower.start()
+    wait_until(lambda: group.stats()['coalesced'] == 1)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert len(errors) == 2
+    assert errors[0] is errors[1]
+
+
+def test_key_runs_again_once_the_call_finished():
+    group = SingleFlight()
+    with pytest.raises(RuntimeError):
+        group.do('key', lambda: (_ for _ in ()).throw(RuntimeError('first')))
+    assert group.do('key', lambda: 'second') == 'second'
+    assert group.stats()['executed'] == 2
+
+
+def test_different_keys_do_not_coalesce():
+    group = SingleFlight()
+    assert group.do('a', lambda: 1) == 1
+    assert group.do('b', lambda: 2) == 2
+    assert group.stats()['coalesced'] == 0
@@ -0,0 +1,84 @@
+import random
+
+import pytest
+
+from urls import (
+    SHORTCODE_ALPHABET,
+    shortcode_from_url,
+    pk_from_shortcode,
+    pks_from_shortcodes,
+    media_pk_from_url,
+    media_pks_from_urls,
+)
+
+
+def shortcode_for(pk):
+    """Inverse of pk_from_shortcode, for building test fixtures."""
+    code = ''
+    while pk:
+        pk, digit = divmod(pk, 64)
+        code = SHORTCODE_ALPHABET[digit] + code
+    return code or 'A'
+
+
+# Small pks, today's 19 digit pks, the uint64 boundary and pks past it
+PKS = [1, 63, 64, 4095, 3174231416123456789, 2 ** 63, 2 ** 64 - 1, 2 ** 64, 2 ** 70 + 12345]
+
+
+@pytest.mark.parametrize('pk', PKS)
+def test_shortcode_round_trip(pk):
+    assert pk_from_shortcode(shortcode_for(pk)) == str(pk)
+
+
+def test_known_shortcode():
+    assert pk_from_shortcode('B') == '1'
+    assert pk_from_shortcode('BA') == '64'
+
+
+def test_vectorized_matches_scalar():
+    rng = random.Random(7)
+    pks = PKS + [rng.getrandbits(rng.randint(1, 72)) for _ in range(500)]
+    codes = [shortcode_for(pk) for pk in pks]
+    assert pks_from_shortcodes(codes) == [pk_from_shortcode(code) for code in codes]
+    assert pks_from_shortcodes(codes) == [str(pk) for pk in pks]
+
+
+def test_vectorized_empty():
+    assert pks_from_shortcodes([]) == []
+
+
+def test_private_suffix_is_ignored():
+    code = shortcode_for(3174231416123456789)
+    private = code + 'x' * 28
+    assert pk_from_shortcode(private) == pk_from_shortcode(code)
+    assert pks_from_shortcodes([private]) == [pk_from_shortcode(code)]
+
+
+@pytest.mark.parametrize('url', [
+    'https://www.instagram.com/p/CodeAbc_-1/',
+    'https://instagram.com/reel/CodeAbc_-1',
+    'http://www.instagram.com/reels/CodeAbc_-1/?igsh=abc',
+    'https://www.instagram.com/tv/CodeAbc_-1/',
+    'https://instagr.am/p/CodeAbc_-1/',
+    'instagram.com/someone/p/CodeAbc_-1/',
+    'https://www.instagram.com/p/CodeAbc_-1/c/17890000000000000/',
+])
+def test_shortcode_from_url(url):
+    assert shortcode_from_url(url) == 'CodeAbc_-1'
+
+
+@pytest.mark.parametrize('url', [None, '', 'bad', 'https://www.instagram.com/someone/', 'https://example.com/p/CodeAbc/'])
+def test_invalid_urls(url):
+    assert shortcode_from_url(url) is None
+
+
+def test_media_pk_from_url():
+    pk = 3174231416123456789
+    assert media_pk_from_url(f"https://www.instagram.com/p/{shortcode_for(pk)}/") == str(pk)
+    with pytest.raises(ValueError):
+        media_pk_from_url('bad')
+
+
+def test_media_pks_from_urls_keeps_positions():
+    urls = ['https://www.instagram.com/p/B/', 'bad', 'https://www.instagram.com/reel/BA/']
+    assert media_pks_from_urls(urls) == ['1', None, '64']
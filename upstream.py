@@ -0,0 +1,85 @@
+import logging
+import threading
+
+import cache
+from sessionpool import load_pool_from_env
+from urls import media_pk_from_url
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Pool of Instagram sessions; every upstream call checks one out for its duration.
+# Built on first use so importing this module never parses or applies a session.
+_session_pool = None
+_session_pool_lock = threading.Lock()
+
+
+def get_session_pool():
+    global _session_pool
+    if _session_pool is None:
+        with _session_pool_lock:
+            if _session_pool is None:
+                pool = load_pool_from_env()
+                pool.start_refresher()
+                _session_pool = pool
+    return _session_pool
+
+
+def call(method, *args, **kwargs):
+    """Runs one instagrapi method on a session checked out from the pool."""
+    with get_session_pool().checkout() as client:
+        return getattr(client, method)(*args, **kwargs)
+
+
+# Cached upstream lookups. Pass bypass=True to force a fresh fetch.
+def fetch_user_info(username, bypass=False):
+    return cache.get_or_load('profile', username.lower(), lambda: call('user_info_by_username', username), bypass=bypass)
+
+
+def fetch_user_medias(user_pk, amount, bypass=False):
+    return cache.get_or_load('medias', f"{user_pk}:{amount}", lambda: call('user_medias', user_pk, amount=amount), bypass=bypass)
+
+
+def fetch_media_info(media_pk, bypass=False):
+    return cache.get_or_load('media', media_pk, lambda: call('media_info', media_pk), bypass=bypass)
+
+
+def fetch_media_likers(media_pk, bypass=False):
+    return cache.get_or_load('likers', media_pk, lambda: call('media_likers', media_pk), bypass=bypass)
+
+
+def fetch_media_comments(media_pk, bypass=False):
+    return cache.get_or_load('comments', media_pk, lambda: call('media_comments', media_pk), bypass=bypass)
+
+
+# Paginated interaction lookups
+def fetch_media_likers_page(media_pk, offset, limit, bypass=False):
+    """One page of likers and the offset of the next page, or None when exhausted.
+
+    Instagram returns a post's likers in a single response, so pages are
+    sliced out of the cached list rather than fetched one by one.
+    """
+    likers = fetch_media_likers(media_pk, bypass=bypass)
+    end = offset + limit
+    return likers[offset:end], (end if end < len(likers) else None)
+
+
+def fetch_media_comments_page(media_pk, min_id, limit, bypass=False):
+    """One page of comments and the upstream cursor of the next page, or None when exhausted."""
+    return cache.get_or_load(
+        'comments',
+        f"{media_pk}:{min_id or ''}:{limit}",
+        lambda: call('media_comments_chunk', media_pk, limit, min_id),
+        bypass=bypass,
+    )
+
+
+def iter_media_comment_pages(media_pk, page_size):
+    """Yields comments page by page as they arrive, without holding the full list."""
+    min_id = None
+    while True:
+        comments, min_id = call('media_comments_chunk', media_pk, page_size, min_id)
+        if comments:
+            yield comments
+        if not min_id:
+            return
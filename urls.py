@@ -0,0 +1,87 @@
+import re
+
+import numpy as np
+
+# Instagram's shortcode alphabet: each character is one base64 digit of the media pk
+SHORTCODE_ALPHABET = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_'
+
+# Shortcodes of private posts carry a 28 character suffix that is not part of the pk
+PRIVATE_SUFFIX_LENGTH = 28
+
+# Post, reel and IGTV links on instagram.com (any subdomain) or the instagr.am short domain,
+# optionally prefixed with the owner's username, with or without a trailing slash or query.
+# Comment permalinks (/p/<code>/c/<comment id>/) resolve to their post.
+POST_URL_RE = re.compile(
+    r'^(?:https?://)?(?:[\w-]+\.)?(?:instagram\.com|instagr\.am)'
+    r'(?:/[\w.]+)?/(?:p|reels?|tv)/([A-Za-z0-9_-]+)(?:/c/\d+)?/?(?:[?#].*)?$',
+    re.IGNORECASE,
+)
+
+_DIGITS = np.full(256, 255, dtype=np.uint8)
+for _value, _char in enumerate(SHORTCODE_ALPHABET):
+    _DIGITS[ord(_char)] = _value
+
+
+def shortcode_from_url(url):
+    """Shortcode of a post/reel/tv URL, or None if it isn't one."""
+    match = POST_URL_RE.match(url.strip()) if isinstance(url, str) else None
+    return match.group(1) if match else None
+
+
+def _trim(shortcode):
+    if len(shortcode) > PRIVATE_SUFFIX_LENGTH:
+        return shortcode[:-PRIVATE_SUFFIX_LENGTH]
+    return shortcode
+
+
+def pk_from_shortcode(shortcode):
+    """Media pk for a shortcode, computed locally."""
+    pk = 0
+    for char in _trim(shortcode):
+        pk = pk * 64 + SHORTCODE_ALPHABET.index(char)
+    return str(pk)
+
+
+def pks_from_shortcodes(shortcodes):
+    """Media pks for many shortcodes in one vectorized pass.
+
+    Shortcodes are right-aligned into a uint8 matrix and folded column by
+    column into uint64 accumulators. The rare code that would not fit in 64
+    bits is converted one at a time instead.
+    """
+    trimmed = [_trim(code) for code in shortcodes]
+    if not trimmed:
+        return []
+    width = max(len(code) for code in trimmed)
+    padded = np.frombuffer(''.join(code.rjust(width, 'A') for code in trimmed).encode('ascii'), dtype=np.uint8)
+    digits = _DIGITS[padded.reshape(len(trimmed), width)].astype(np.uint64)
+
+    accumulator = np.zeros(len(trimmed), dtype=np.uint64)
+    for column in range(width):
+        accumulator = (accumulator << np.uint64(6)) | digits[:, column]
+
+    pks = [str(int(pk)) for pk in accumulator]
+    # 64 bits hold ten full digits plus four bits of an eleventh; wider codes are converted one by one
+    lengths = np.fromiter((len(code) for code in trimmed), dtype=np.int64, count=len(trimmed))
+    first_digits = digits[np.arange(len(trimmed)), width - lengths]
+    for index in np.flatnonzero((lengths > 11) | ((lengths == 11) & (first_digits >= 16))):
+        pks[index] = pk_from_shortcode(trimmed[index])
+    return pks
+
+
+def media_pk_from_url(url):
+    """Media pk for a post/reel/tv URL without any network call. Raises ValueError if invalid."""
+    shortcode = shortcode_from_url(url)
+    if shortcode is None:
+        raise ValueError(f"Invalid post URL: {url}")
+    return pk_from_shortcode(shortcode)
+
+
+def media_pks_from_urls(urls):
+    """Media pks for a list of URLs, with None for every URL that isn't a post link."""
+    shortcodes = [shortcode_from_url(url) for url in urls]
+    valid = [index for index, code in enumerate(shortcodes) if code is not None]
+    pks = [None] * len(urls)
+    for index, pk in zip(valid, pks_from_shortcodes([shortcodes[index] for index in valid])):
+        pks[index] = pk
+    return pks
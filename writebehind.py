@@ -0,0 +1,143 @@
+import os
+import atexit
+import logging
+import threading
+
+from dotenv import load_dotenv
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Flush triggers, overridable from the environment
+WRITE_BEHIND_MAX_ITEMS = int(os.getenv('WRITE_BEHIND_MAX_ITEMS', '100'))
+WRITE_BEHIND_INTERVAL = float(os.getenv('WRITE_BEHIND_INTERVAL', '2'))
+# Bounds for when the database is down or rejects a row: the buffer never holds more than
+# MAX_PENDING rows, and a row is dropped after failing MAX_RETRIES flushes
+WRITE_BEHIND_MAX_PENDING = int(os.getenv('WRITE_BEHIND_MAX_PENDING', '10000'))
+WRITE_BEHIND_MAX_RETRIES = int(os.getenv('WRITE_BEHIND_MAX_RETRIES', '10'))
+
+
+class WriteBehindBuffer:
+    """Collects rows keyed by identity and hands them to flush_fn in batches.
+
+    Later writes for the same key replace earlier ones, so a batch never
+    touches the same row twice. A flush happens when the buffer reaches
+    max_items or every interval seconds, whichever comes first, and runs
+    inside the Flask app context given to start().
+
+    A failed batch is retried on later flushes. Rows that keep failing are
+    written one by one on their last attempt, so a single bad row can't sink
+    the rest, and dropped (and counted) if they still fail.
+    """
+
+    def __init__(self, name, flush_fn, max_items=WRITE_BEHIND_MAX_ITEMS, interval=WRITE_BEHIND_INTERVAL,
+                 max_pending=WRITE_BEHIND_MAX_PENDING, max_retries=WRITE_BEHIND_MAX_RETRIES):
+        self.name = name
+        self.flush_fn = flush_fn
+        self.max_items = max_items
+        self.interval = interval
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self._rows = {}
+        # Failed flushes per key, reset whenever a newer row for the key arrives
+        self._attempts = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._app = None
+        self._thread = None
+        self.flushes = 0
+        self.rows_written = 0
+        self.failures = 0
+        self.dropped = 0
+
+    def add(self, key, row):
+        overflow = None
+        with self._lock:
+            if key not in self._rows and len(self._rows) >= self.max_pending:
+                # Full while the database is unreachable: the oldest pending row makes room
+                overflow = next(iter(self._rows))
+                del self._rows[overflow]
+                self._attempts.pop(overflow, None)
+                self.dropped += 1
+            self._rows[key] = row
+            self._attempts.pop(key, None)
+            full = len(self._rows) >= self.max_items
+        if overflow is not None:
+            logger.warning(f"Write-behind buffer {self.name} is full, dropped pending row {overflow} ({self.dropped} dropped so far)")
+        if full:
+            self._wake.set()
+
+    def _write(self, rows):
+        if self._app is not None:
+            with self._app.app_context():
+                self.flush_fn(rows)
+        else:
+            self.flush_fn(rows)
+
+    def flush(self):
+        # One flush at a time, so batches reach the database in order
+        with self._flush_lock:
+            with self._lock:
+                rows, self._rows = self._rows, {}
+                attempts = {key: self._attempts.pop(key, 0) for key in rows}
+            if not rows:
+                return
+            try:
+                self._write(list(rows.values()))
+                self.flushes += 1
+                self.rows_written += len(rows)
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Write-behind flush of {len(rows)} {self.name} rows failed: {str(e)}")
+                self._retry_later(rows, attempts)
+
+    def _retry_later(self, rows, attempts):
+        """Puts a failed batch back, except rows that used up their retries, which get one last try alone."""
+        last_tries = []
+        with self._lock:
+            for key, row in rows.items():
+                if key in self._rows:
+                    # A newer value arrived meanwhile and replaces this one
+                    continue
+                if attempts[key] + 1 >= self.max_retries:
+                    last_tries.append((key, row))
+                else:
+                    self._rows[key] = row
+                    self._attempts[key] = attempts[key] + 1
+        for key, row in last_tries:
+            try:
+                self._write([row])
+                self.rows_written += 1
+            except Exception as e:
+                self.dropped += 1
+                logger.error(f"Dropping {self.name} row {key} after {self.max_retries} failed writes: {str(e)}")
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def start(self, app=None):
+        if self._thread is not None:
+            return
+        self._app = app
+        self._thread = threading.Thread(target=self._run, name=f"write-behind-{self.name}", daemon=True)
+        self._thread.start()
+        # Don't lose buffered rows on a clean worker shutdown
+        atexit.register(self.flush)
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._rows)
+        return {
+            'pending': pending,
+            'flushes': self.flushes,
+            'rows_written': self.rows_written,
+            'failures': self.failures,
+            'dropped': self.dropped,
+        }